@@ -0,0 +1,119 @@
+import os
+import glob
+import tempfile
+
+import matplotlib
+
+# no plot windows from the run_* stages
+matplotlib.use("Agg")
+
+import click
+import numpy as np
+import pandas as pd
+
+import cropping
+import run_full_pipeline
+from benchmarks.synthetic import synthetic_frames
+from helpers.CLI_options import check_n_frames_option
+
+RESOLUTION = (96, 96)
+CROP_FACTOR = 2
+RADIUS = 6
+PIPELINE_PARAMS = {
+    "crop_factor": CROP_FACTOR,
+    "bayer": False,
+    "format": "dng",
+    "center_x": 24,
+    "center_y": 24,
+    "radius": RADIUS,
+    "offset": 4,
+    "weight": 0.1,
+    "kernel": "CA",
+    "kernel_size": 3,
+    "accumulate": True,
+    "normalize": False,
+    "n_workers": 2,
+    "profile": False,
+}
+
+
+def _synthetic_decoder(filenames: list[str], frames: np.ndarray):
+    # stands in for iter_cropped_frames, so no DNG files have to be written
+    def iter_cropped_frames(
+        input_dir, is_raw, crop_factor, n_workers=None, bayer=False
+    ):
+        height, width = frames.shape[1:3]
+        size = min(height, width) // crop_factor
+        top, left = (height - size) // 2, (width - size) // 2
+        for filename, frame in zip(filenames, frames):
+            yield filename, frame[top : top + size, left : left + size]
+
+    return iter_cropped_frames
+
+
+def run_mode(input_dir: str, in_memory: bool) -> dict[str, pd.DataFrame]:
+    """Run full_pipeline on input_dir and return the metrics_overview.csv of every channel."""
+    run_full_pipeline.full_pipeline.main(
+        [
+            f"--{name}={value}"
+            for name, value in {
+                "input_dir": input_dir,
+                **PIPELINE_PARAMS,
+                "in_memory": in_memory,
+                "use_cache": False,
+                "write_intermediate": False,
+            }.items()
+        ],
+        standalone_mode=False,
+    )
+    paths = glob.glob(os.path.join(input_dir, "cropped*", "*", "metrics_overview.csv"))
+    return {
+        os.path.relpath(path, input_dir): pd.read_csv(path, index_col=0)
+        for path in sorted(paths)
+    }
+
+
+@click.command()
+@check_n_frames_option
+def check_pipeline_modes(n_frames: int):
+    """
+    Check that full_pipeline writes the same metrics_overview.csv on disk and in memory.
+    Runs both modes on synthetic 3-channel frames named IMG_1 ... IMG_<n_frames> (use more than
+    10 frames, so names that do not sort lexicographically are covered). Exits with an error on
+    the first difference.
+    """
+    filenames = [f"IMG_{i + 1}.dng" for i in range(n_frames)]
+    frames = synthetic_frames(RESOLUTION, n_frames, radius=RADIUS * CROP_FACTOR)
+
+    decoder = _synthetic_decoder(filenames, frames)
+    cropping.iter_cropped_frames = decoder
+    run_full_pipeline.iter_cropped_frames = decoder
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for in_memory in (False, True):
+            input_dir = os.path.join(tmp_dir, "in_memory" if in_memory else "on_disk")
+            os.makedirs(input_dir)
+            # empty placeholders, listed and fingerprinted like the DNGs of a dataset
+            for filename in filenames:
+                open(os.path.join(input_dir, filename), "w").close()
+            results.append(run_mode(input_dir, in_memory))
+
+    on_disk, in_memory = results
+    if not on_disk or on_disk.keys() != in_memory.keys():
+        raise click.ClickException(
+            f"Different metrics files: {sorted(on_disk)} / {sorted(in_memory)}"
+        )
+    for path, df in on_disk.items():
+        if list(df["image"]) != filenames:
+            raise click.ClickException(f"{path}: images not in crop order")
+        try:
+            pd.testing.assert_frame_equal(df, in_memory[path])
+        except AssertionError as e:
+            raise click.ClickException(f"{path} differs between the modes:\n{e}")
+
+    print(f"On disk and in memory modes agree for {len(on_disk)} channels")
+
+
+if __name__ == "__main__":
+    check_pipeline_modes()
@@ -0,0 +1,252 @@
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+from typing import Callable
+
+import click
+import numpy as np
+
+from benchmarks.synthetic import camera_frames
+from camera_configs import RADII, RESOLUTIONS
+from cropping import crop
+from denoising.NREA import NREA
+from denoising.ROF import ROF_denoising
+from denoising.image_stacking import mean_stacking, median_stacking
+from metrics.SNR_metrics import calc_SNR
+from helpers.helpers import save_tiff_16bit
+from helpers.CLI_options import (
+    cameras_option,
+    n_frames_option,
+    benchmarks_option,
+    repeats_option,
+    baseline_option,
+)
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the vendored N2V package imports itself as n2v, as in the notebooks run from this folder
+N2V_DIR = os.path.join(REPO_DIR, "n2v")
+
+ROF_WEIGHT = 0.1
+CROP_FACTOR = 2
+N2V_PATCH_SHAPE = (64, 64)
+N2V_BATCH_SIZE = 16
+
+
+def _git(*args) -> str | None:
+    try:
+        return subprocess.run(
+            ["git", *args], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> dict:
+    """Commit and machine a run belongs to, to compare results across commits."""
+    status = _git("status", "--porcelain", "--untracked-files=no")
+    return {
+        "git_commit": _git("rev-parse", "HEAD"),
+        "git_dirty": None if status is None else bool(status),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def time_repeats(func: Callable, repeats: int, setup: Callable = None) -> list[float]:
+    """Wall times of repeats calls of func(setup()), setup is not timed."""
+    times = []
+    for _ in range(repeats):
+        argument = setup() if setup is not None else None
+        start = time.perf_counter()
+        func(argument)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def _n2v_data_wrapper(frames: np.ndarray) -> Callable:
+    # the N2V package (and TensorFlow) are only needed for this benchmark
+    if N2V_DIR not in sys.path:
+        sys.path.insert(0, N2V_DIR)
+    if getattr(sys.modules.get("n2v"), "__file__", "") is None:
+        # the n2v/ folder itself, imported as namespace package from the repository root
+        del sys.modules["n2v"]
+    from n2v.internals.N2V_DataWrapper import N2V_DataWrapper
+    from n2v.utils.n2v_utils import pm_uniform_withCP
+
+    X = frames.astype(np.float32)
+    Y = np.concatenate([X, np.zeros_like(X)], axis=-1)
+    n_batches = max(1, len(X) // N2V_BATCH_SIZE)
+    wrapper = N2V_DataWrapper(
+        X,
+        Y,
+        N2V_BATCH_SIZE,
+        length=n_batches,
+        shape=N2V_PATCH_SHAPE,
+        value_manipulation=pm_uniform_withCP(5),
+    )
+
+    def run(_):
+        for i in range(n_batches):
+            wrapper[i]
+
+    return run
+
+
+def benchmark_cases(
+    camera: str, frames: np.ndarray, tmp_dir: str
+) -> tuple[dict[str, tuple], dict[str, str]]:
+    """
+    Timed operations on one camera's frames.
+
+    Returns:
+    ({name: (func, setup, frames processed per call)}, {name: reason} of skipped benchmarks)
+    """
+    width, height = RESOLUTIONS[camera]
+    center = (width // 2, height // 2)
+    radius = RADII[camera]
+    n_frames = len(frames)
+
+    def write_tiffs():
+        # crop reads single-channel TIFFs, writing them is not timed
+        input_dir = tempfile.mkdtemp(prefix="crop_", dir=tmp_dir)
+        for i, frame in enumerate(frames):
+            save_tiff_16bit(frame[..., 1], os.path.join(input_dir, f"frame_{i}.tiff"))
+        return input_dir
+
+    cases = {
+        "NREA": (
+            lambda _: NREA(frames, gaussian_blurring=False, kernel_radius=radius),
+            None,
+            n_frames,
+        ),
+        "ROF_denoising": (lambda _: ROF_denoising(frames[0], ROF_WEIGHT), None, 1),
+        "mean_stacking": (lambda _: mean_stacking(frames), None, n_frames),
+        "median_stacking": (lambda _: median_stacking(frames), None, n_frames),
+        "calc_SNR": (
+            lambda _: [calc_SNR(frame, center, radius) for frame in frames],
+            None,
+            n_frames,
+        ),
+        "crop": (
+            lambda input_dir: crop(input_dir, False, CROP_FACTOR, n_workers=1),
+            write_tiffs,
+            n_frames,
+        ),
+    }
+    skipped = {}
+    try:
+        cases["N2V_DataWrapper"] = (_n2v_data_wrapper(frames), None, n_frames)
+    except ImportError as e:
+        skipped["N2V_DataWrapper"] = f"N2V not available: {e}"
+
+    return cases, skipped
+
+
+def compare(baseline: dict, results: dict) -> None:
+    """Print the speedup of every benchmark in results over the same benchmark in baseline."""
+    baseline_times = {
+        (r["camera"], r["benchmark"]): r["min_s"]
+        for r in baseline["results"]
+        if r.get("min_s") is not None
+    }
+    print(
+        f"Speedup over {baseline['environment']['git_commit']} "
+        f"(> 1: faster than baseline)"
+    )
+    for r in results["results"]:
+        key = (r["camera"], r["benchmark"])
+        if r.get("min_s") and key in baseline_times:
+            print(
+                f"{r['camera']:>12} {r['benchmark']:>16}: {baseline_times[key] / r['min_s']:.2f}x"
+            )
+
+
+@click.command()
+@cameras_option
+@n_frames_option
+@benchmarks_option
+@repeats_option
+@baseline_option
+def run_benchmarks(
+    cameras: str,
+    n_frames: int,
+    benchmarks: str = "all",
+    repeats: int = 3,
+    baseline: str = "",
+):
+    """
+    Time the main operations on synthetic LED frames at the resolutions of camera_configs and
+    save the results with the current commit to benchmarks/results/, so runs of different
+    commits can be compared (see --baseline). No camera data is needed.
+    ROF_denoising of full frames takes minutes at the larger resolutions, --benchmarks selects
+    a subset.
+    Run from the repository root: python -m benchmarks.run_benchmarks
+    """
+    selected = None
+    if benchmarks.strip().lower() != "all":
+        selected = {b.strip() for b in benchmarks.split(",") if b.strip()}
+
+    results = {"environment": environment(), "n_frames": n_frames, "results": []}
+
+    for camera in [c.strip() for c in cameras.split(",") if c.strip()]:
+        if camera not in RESOLUTIONS:
+            raise click.BadParameter(
+                f"Unknown camera {camera}, use one of {list(RESOLUTIONS)}"
+            )
+        frames = camera_frames(camera, n_frames)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cases, skipped = benchmark_cases(camera, frames, tmp_dir)
+            if selected is not None:
+                cases = {n: c for n, c in cases.items() if n in selected}
+                skipped = {n: r for n, r in skipped.items() if n in selected}
+            for name, (func, setup, frames_per_call) in cases.items():
+                times = time_repeats(func, repeats, setup)
+                results["results"].append(
+                    {
+                        "camera": camera,
+                        "benchmark": name,
+                        "shape": list(frames.shape[1:]),
+                        "frames_per_call": frames_per_call,
+                        "times_s": times,
+                        "min_s": min(times),
+                        "median_s": float(np.median(times)),
+                        "frames_per_s": frames_per_call / min(times),
+                    }
+                )
+                print(
+                    f"{camera:>12} {name:>16}: {min(times):.4f} s "
+                    f"({frames_per_call / min(times):.1f} frames/s)"
+                )
+
+        for name, reason in skipped.items():
+            results["results"].append(
+                {"camera": camera, "benchmark": name, "skipped": reason}
+            )
+            print(f"{camera:>12} {name:>16}: skipped, {reason}")
+
+    commit = results["environment"]["git_commit"] or "unknown"
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output_path = os.path.join(RESULTS_DIR, f"benchmark_{commit[:8]}_{timestamp}.json")
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved results to {output_path}")
+
+    if baseline:
+        with open(baseline) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    run_benchmarks()
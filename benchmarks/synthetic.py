@@ -0,0 +1,80 @@
+import numpy as np
+
+from camera_configs import RADII, RESOLUTIONS
+
+MAX_VALUE = 2**16 - 1
+
+
+def led_profile(
+    shape: tuple[int, int], center: tuple[float, float], radius: float, led: str
+) -> np.ndarray:
+    """
+    Relative LED intensity per pixel, 1 at the center.
+    - center: (x, y)
+    - led: "disk" (uniform within radius) or "gaussian" (sigma = radius / 2)
+    """
+    y, x = np.ogrid[: shape[0], : shape[1]]
+    distance_squared = (x - center[0]) ** 2 + (y - center[1]) ** 2
+    if led == "disk":
+        return (distance_squared <= radius**2).astype(np.float64)
+    if led == "gaussian":
+        sigma = radius / 2
+        return np.exp(-distance_squared / (2 * sigma**2))
+    raise ValueError(f"Unknown LED profile {led}, use disk or gaussian")
+
+
+def synthetic_frames(
+    resolution: tuple[int, int],
+    n_frames: int,
+    center: tuple[float, float] = None,
+    radius: float = 10,
+    led: str = "disk",
+    led_photons: float = 200.0,
+    background_photons: float = 50.0,
+    read_noise: float = 5.0,
+    channels: int = 3,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    Frames of a weak LED on a dark background with shot (Poisson) and read (Gaussian) noise,
+    as 16-bit stack of shape (n_frames, height, width[, channels]).
+    - resolution: (width, height)
+    - center: (x, y) of the LED, defaults to the image center
+    - led_photons, background_photons: mean signal of the LED center and the background
+    - read_noise: standard deviation of the read noise
+    - channels: 0 for single-channel frames
+    - seed: frames are reproducible for the same seed
+    """
+    width, height = resolution
+    if center is None:
+        center = (width / 2, height / 2)
+
+    expected = background_photons + led_photons * led_profile(
+        (height, width), center, radius, led
+    )
+    frame_shape = (height, width, channels) if channels else (height, width)
+    if channels:
+        expected = expected[..., None]
+
+    rng = np.random.default_rng(seed)
+    frames = np.empty((n_frames, *frame_shape), dtype=np.uint16)
+    for i in range(n_frames):
+        frame = rng.poisson(np.broadcast_to(expected, frame_shape)).astype(np.float64)
+        frame += rng.normal(0, read_noise, frame_shape)
+        frames[i] = np.clip(np.round(frame), 0, MAX_VALUE)
+
+    return frames
+
+
+def camera_frames(
+    camera: str, n_frames: int, channels: int = 3, seed: int = 0, **kwargs
+) -> np.ndarray:
+    """synthetic_frames at the resolution of a camera in camera_configs, with its LED radius."""
+    return synthetic_frames(
+        RESOLUTIONS[camera],
+        n_frames,
+        radius=RADII[camera],
+        channels=channels,
+        seed=seed,
+        **kwargs,
+    )
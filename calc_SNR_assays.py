@@ -8,9 +8,12 @@ from scipy.ndimage import rotate
 import matplotlib.pyplot as plt
 from tqdm import tqdm
 
+from metrics.multi_roi import cached_multi_roi_measurement
+from metrics.results_sink import ResultsSink
 from helpers.helpers import (
     normalize_path,
-    load_images_from_folder,
+    list_image_files,
+    load_image,
 )
 
 input_dir = ""
@@ -22,109 +25,101 @@ data_file = ""
 data_file = normalize_path(data_file)
 df_data = pd.read_csv(data_file)
 
-df_result = pd.DataFrame(columns=["filename", "row", "well", "signal", "noise", "SNR"])
-
 plot_single_well_mask = False
 plot_mask = False
 
 blue_channel = False
 
 output_dir = input_dir + "/SNR_metrics"
+output_path = (
+    output_dir + "/metrics" + ("_blue_channel" if blue_channel else "") + ".csv"
+)
 
 file_format = "dng" if is_raw else "tiff"
-images, filenames = load_images_from_folder(
-    input_dir, file_format=file_format, bit_depth=16
-)
+filenames = list_image_files(input_dir, file_format)
+
+# continue an interrupted run: images already in the csv are skipped
+resume = False
+
+# results are written in chunks
+with ResultsSink(
+    output_path,
+    ["filename", "row", "well", "signal", "noise", "SNR", "mean_roi"],
+    key="filename",
+    resume=resume,
+    params={"data_file": data_file, "blue_channel": blue_channel},
+) as sink:
+    for filename in tqdm(filenames, total=len(filenames)):
+        if sink.done(filename):
+            continue
+
+        image_name = filename.split(".")[0]
+        image = load_image(os.path.join(input_dir, filename), bit_depth=16)
+
+        # get blue channel
+        if blue_channel:
+            image = image[:, :, 2]
+
+        df_filename = df_data.loc[df_data["basename"] == image_name]
+
+        if df_filename.empty:
+            print(f"No data found for {filename}")
+            continue
+
+        # rotate image
+        rotation = re.search(r"\d+", df_filename["orientation"].iloc[0])
+        if rotation:
+            image = rotate(image, int(rotation.group()), reshape=True)
+
+        # wells and background of this plate layout, the label image is cached per geometry
+        height = df_filename["height"].iloc[0]
+        width = df_filename["width"].iloc[0]
+        if image.shape[:2] != (height, width):
+            raise ValueError(
+                f"{filename} has shape {image.shape[:2]}, expected {(height, width)}"
+            )
+        measurement = cached_multi_roi_measurement(
+            image.shape,
+            tuple(zip(df_filename["center_x"], df_filename["center_y"])),
+            tuple(df_filename["sensor_size"]),
+        )
 
-for i, (image, filename) in tqdm(enumerate(zip(images, filenames)), total=len(images)):
-    image_name = filename.split(".")[0]
-
-    # get blue channel
-    if blue_channel:
-        image = image[:, :, 2]
-
-    df_filename = df_data.loc[df_data["basename"] == image_name]
-
-    # rotate image
-    rotation = re.search(r"\d+", df_filename["orientation"].iloc[0])
-    if rotation:
-        image = rotate(image, int(rotation.group()), reshape=True)
-
-    if df_filename.empty:
-        print(f"No data found for {filename}")
-        continue
-
-    # create mask with detected wells and background
-    height = df_filename["height"].iloc[0]
-    width = df_filename["width"].iloc[0]
-    mask = np.zeros((height, width), dtype=bool)
-
-    for index, row in df_filename.iterrows():
-        sensor_size = row["sensor_size"]
-        center_x = row["center_x"]
-        center_y = row["center_y"]
-        center_well = (center_x, center_y)
-
-        y, x = np.ogrid[:height, :width]
-        distance = np.sqrt((x - center_well[0]) ** 2 + (y - center_well[1]) ** 2)
-
-        single_well_mask = distance <= sensor_size / 2
-        mask |= single_well_mask
-
-        mean_roi = np.mean(image[single_well_mask])
-
-        df_result = pd.concat(
-            [
-                df_result,
-                pd.DataFrame(
-                    {
-                        "filename": [filename],
-                        "row": [row["row"]],
-                        "well": [row["well"]],
-                        "mean_roi": [mean_roi],
-                    }
-                ),
-            ]
+        mean_rois, mean_bg, noise = measurement.evaluate(image)
+        signals = mean_rois - mean_bg
+
+        # all wells of an image are added at once
+        sink.extend(
+            {
+                "filename": [filename] * len(mean_rois),
+                "row": list(df_filename["row"]),
+                "well": list(df_filename["well"]),
+                "signal": list(signals),
+                "noise": [noise] * len(mean_rois),
+                "SNR": list(signals / noise),
+                "mean_roi": list(mean_rois),
+            }
         )
 
-        if plot_single_well_mask:
+        for well_index in range(len(mean_rois)):
+            if plot_single_well_mask:
+                plt.imshow(image)
+                mask_show = measurement.well_mask(well_index).astype(np.float32)
+                plt.imshow(
+                    np.dstack(
+                        (mask_show, np.zeros_like(mask_show), np.zeros_like(mask_show))
+                    ),
+                    cmap="Reds",
+                )
+                plt.show()
+
+        if plot_mask:
             plt.imshow(image)
-            mask_show = single_well_mask.astype(np.float32)
+            bg_mask = measurement.background_mask().astype(np.float32)
             plt.imshow(
-                np.dstack(
-                    (mask_show, np.zeros_like(mask_show), np.zeros_like(mask_show))
-                ),
+                np.dstack((bg_mask, np.zeros_like(bg_mask), np.zeros_like(bg_mask))),
+                alpha=0.3,
                 cmap="Reds",
             )
             plt.show()
 
-    bg_mask = ~mask
-    # noise = np.std(image[bg_mask])
-    mean_bg = np.mean(image[bg_mask])
-    noise = np.std(image)
-    df_result.loc[df_result["filename"] == filename, "signal"] = (
-        df_result.loc[df_result["filename"] == filename, "mean_roi"] - mean_bg
-    )
-    df_result.loc[df_result["filename"] == filename, "noise"] = noise
-    df_result.loc[df_result["filename"] == filename, "SNR"] = (
-        df_result.loc[df_result["filename"] == filename, "signal"] / noise
-    )
-
-    if plot_mask:
-        plt.imshow(image)
-        bg_mask = bg_mask.astype(np.float32)
-        plt.imshow(
-            np.dstack((bg_mask, np.zeros_like(bg_mask), np.zeros_like(bg_mask))),
-            alpha=0.3,
-            cmap="Reds",
-        )
-        plt.show()
-
-        print(bg_mask.shape)
-
-if not os.path.exists(output_dir):
-    os.makedirs(output_dir)
-df_result.to_csv(
-    output_dir + "/metrics" + ("_blue_channel" if blue_channel else "") + ".csv",
-    index=False,
-)
+            print(bg_mask.shape)
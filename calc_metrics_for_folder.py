@@ -1,8 +1,9 @@
 import click
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 
-from metrics.SNR_metrics import calc_SNR
+from metrics.SNR_metrics import SNRMeasurement
 from helpers.helpers import load_images_from_folder
 from helpers.CLI_options import (
     input_dir_option,
@@ -20,29 +21,50 @@ def calc_metrics_for_folder(
     center_y: int,
     radius: int,
     offset: int = None,
+    window: tuple[int, int, int, int] = None,
 ):
-    """Calculate SNR metrics for all images in a folder and save them to a csv file."""
+    """
+    Calculate SNR metrics for all images in a folder and save them to a csv file,
+    one row per image indexed by its file name.
+    - window: (x, y, width, height), only this region of the images is loaded and the background
+      is sampled within it. center_x / center_y are given in full-frame coordinates.
+    """
 
     # LOAD IMAGES
-    images, _ = load_images_from_folder(input_dir, file_format=format, bit_depth=16)
+    images, filenames = load_images_from_folder(
+        input_dir, file_format=format, bit_depth=16, window=window
+    )
 
     center = (center_x, center_y)
+    if window is not None:
+        center = (center_x - window[0], center_y - window[1])
 
-    metrics = []
-    for image in tqdm(images, desc="Calculating metrics", total=len(images)):
-        snr, signal, noise, _, _ = calc_SNR(
-            image, center, radius, offset, show_sample_position=False
-        )
-        metrics.append([snr, signal, noise])
-
-    # save metrics to csv
-    df = pd.DataFrame(metrics, columns=["SNR", "Signal", "Noise"])
+    df = calc_metrics(images, center, radius, offset)
+    df.index = pd.Index(filenames, name="image")
 
     df.to_csv(input_dir + "/all_metrics.csv")
 
     return df
 
 
+def calc_metrics(
+    images: list[np.ndarray] | np.ndarray,
+    center: tuple[int, int],
+    radius: int,
+    offset: int = None,
+) -> pd.DataFrame:
+    """SNR, signal and noise of every image, the sample mask is reused for images of the same shape."""
+    metrics = []
+    measurement = None
+    for image in tqdm(images, desc="Calculating metrics", total=len(images)):
+        if measurement is None or measurement.shape != image.shape:
+            measurement = SNRMeasurement(image.shape, center, radius, offset)
+        snr, signal, noise, _, _ = measurement.evaluate(image)
+        metrics.append([snr, signal, noise])
+
+    return pd.DataFrame(metrics, columns=["SNR", "Signal", "Noise"])
+
+
 @click.command()
 @input_dir_option
 @format_option
@@ -2,7 +2,7 @@ import os
 import click
 
 from metrics.metrics_reliability import metrics_reliability, save_metrics_csv
-from helpers.helpers import load_images_from_folder, load_dngs_from_folder
+from helpers.frame_stack import load_frames, stack_base_dir
 from helpers.CLI_options import (
     input_dir_option,
     is_raw_option,
@@ -21,16 +21,14 @@ from helpers.CLI_options import (
 def calc_metrics_reliability(
     input_dir: str, is_raw: bool, center_x: int, center_y: int, radius: int
 ):
-    output_dir = input_dir + "/metrics_reliability"
+    output_dir = stack_base_dir(input_dir) + "/metrics_reliability"
 
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
     # LOAD IMAGES
     file_format = "dng" if is_raw else "tiff"
-    images, _ = load_images_from_folder(
-        input_dir, file_format=file_format, bit_depth=16
-    )
+    images, _ = load_frames(input_dir, file_format=file_format, bit_depth=16)
 
     center = (center_x, center_y)
 
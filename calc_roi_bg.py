@@ -1,43 +1,40 @@
-import pandas as pd
+import os
 from tqdm import tqdm
 
-from helpers.helpers import load_images_from_folder
+from helpers.helpers import list_image_files, load_image
 from metrics.SNR_metrics import calc_SNR
+from metrics.results_sink import ResultsSink
 
 from camera_configs import *
 
 input_dir = ""
 
 file_format = "tiff"
-images, filenames = load_images_from_folder(
-    input_dir, file_format=file_format, bit_depth=16
-)
+filenames = list_image_files(input_dir, file_format)
 
 phone = "Huawei P20"
 center = CENTERS[phone]["cropped2"]
 radius = RADII["Smartphone"]
 
-df = pd.DataFrame(columns=["smartphone", "image", "ROI", "BG"])
-
-for i, image in tqdm(enumerate(images), total=len(images)):
-    _, _, _, mean_roi, mean_bg = calc_SNR(
-        image, center, radius, show_sample_position=False
-    )
-
-    df = pd.concat(
-        [
-            df,
-            pd.DataFrame(
-                {
-                    "smartphone": [phone],
-                    "image": [filenames[i]],
-                    "ROI": [mean_roi],
-                    "BG": [mean_bg],
-                }
-            ),
-        ]
-    )
-
 output_path = input_dir + "/ROI_BG_data.csv"
 
-df.to_csv(output_path, index=False)
+# continue an interrupted run: images already in the csv are skipped
+resume = False
+
+with ResultsSink(
+    output_path,
+    ["smartphone", "image", "ROI", "BG"],
+    key="image",
+    resume=resume,
+    params={"smartphone": phone, "center": center, "radius": radius},
+) as sink:
+    for filename in tqdm(filenames, total=len(filenames)):
+        if sink.done(filename):
+            continue
+
+        image = load_image(os.path.join(input_dir, filename), bit_depth=16)
+        _, _, _, mean_roi, mean_bg = calc_SNR(
+            image, center, radius, show_sample_position=False
+        )
+
+        sink.append(smartphone=phone, image=filename, ROI=mean_roi, BG=mean_bg)
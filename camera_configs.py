@@ -18,6 +18,13 @@ RADII = {
     "OV": 10,
 }
 
+# sensor resolutions (width, height), e.g. for synthetic benchmark frames
+RESOLUTIONS = {
+    "Smartphone": (4000, 3000),  # 12 MP main cameras (Huawei P20, Xiaomi 13 Pro binned)
+    "Arducam": (2592, 1944),
+    "OV": (320, 240),
+}
+
 # native / custom app comparison configs
 CENTERS_NCC = {
     # "X13P": {"native": (1540, 2100), "dp20": (2090, 1530)},
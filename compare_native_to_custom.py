@@ -1,4 +1,5 @@
 import os
+import time
 import pandas as pd
 from pathlib import Path
 import click
@@ -9,8 +10,16 @@ import matplotlib.transforms as transforms
 from tqdm import tqdm
 
 from metrics.SNR_metrics import calc_SNR
+from metrics.results_sink import ResultsSink
 from helpers.helpers import load_image
-from helpers.CLI_options import input_dir_option, channel_wise_option, offset_option
+from helpers.parallel import bounded_imap, default_n_workers
+from helpers.CLI_options import (
+    input_dir_option,
+    channel_wise_option,
+    offset_option,
+    n_workers_option,
+    resume_option,
+)
 from paperplots.helpers.plot import (
     create_figure,
     configure_axes,
@@ -211,47 +220,20 @@ def plot_deviations(
     plt.close()
 
 
-@click.command()
-@input_dir_option
-@channel_wise_option
-@offset_option
-def compare_native_to_custom(
-    input_dir: str, channel_wise: bool, offset: int
-) -> pd.DataFrame:
-    """
-    Calculate SNR metrics for all images in a set of ISO and exposure time settings for both custom and native camera apps.
+COLUMNS = ["smartphone", "app", "iso", "expot", "SNR", "Signal", "Noise", "file"]
 
-    Images are expected in the following folder structure:
-    - input_dir: Root folder for a specific smartphone.
-    - custom: Subfolder containing images taken with the custom camera app.
-    - native: Subfolder containing images taken with the native camera app.
-        - Each of these subfolders (custom and native) contains subfolders named in the format isoXexpoY,
-        where X represents the ISO value and Y represents the exposure time.
-        - Each isoXexpoY subfolder contains the images taken at the corresponding ISO and exposure time setting.
 
+def enumerate_jobs(input_dir: str) -> tuple[list[tuple], set, str]:
     """
-    if channel_wise:
-        channel_data = []
-        for channel in range(3):
-            channel_data.append(
-                pd.DataFrame(
-                    columns=[
-                        "smartphone",
-                        "app",
-                        "iso",
-                        "expot",
-                        "SNR",
-                        "Signal",
-                        "Noise",
-                    ]
-                )
-            )
-    else:
-        data = pd.DataFrame(
-            columns=["smartphone", "app", "iso", "expot", "SNR", "Signal", "Noise"]
-        )
+    Collect one job per DNG in the smartphone/app/isoXexpoY folders below input_dir.
 
+    Returns:
+    (jobs as (img_path, smartphone, app, iso, expot, center, radius), set of (iso, expot) pairs,
+    smartphone of the last folder visited)
+    """
+    jobs = []
     iso_expot_pairs = set()
+    smartphone = None
 
     for root, dirs, files in os.walk(input_dir):
         if not files:
@@ -273,84 +255,189 @@ def compare_native_to_custom(
             center = CENTERS_NCC[smartphone][app]
             radius = RADII_NCC[smartphone]
 
-            for file in tqdm(
-                files,
-                desc=f"Processing {smartphone} {app} {iso_expot}",
-                total=len(files),
-            ):
+            for file in files:
                 img_path = os.path.join(root, file)
                 if not img_path.endswith(".dng"):
                     continue
+                jobs.append((img_path, smartphone, app, iso, expot, center, radius))
+
+    return jobs, iso_expot_pairs, smartphone
+
+
+def _measure_job(
+    task: tuple[tuple, bool, int],
+) -> tuple[list[tuple[float, float, float]], int, float]:
+    # decode one DNG and return (SNR, Signal, Noise) per channel, or for the whole image,
+    # with the worker's pid and the time it spent on the job
+    start = time.perf_counter()
+    metrics = _job_metrics(*task)
+    return metrics, os.getpid(), time.perf_counter() - start
+
+
+def _job_metrics(
+    job: tuple, channel_wise: bool, offset: int
+) -> list[tuple[float, float, float]]:
+    img_path, _, _, _, _, center, radius = job
 
-                img = load_image(img_path, bit_depth=16)
-
-                if channel_wise:
-                    # iterate over channels
-                    for channel in range(3):
-                        img_channel = img[:, :, channel]
-
-                        snr, signal, noise, _, _ = calc_SNR(
-                            img_channel,
-                            center,
-                            radius,
-                            offset_background=offset,
-                            show_sample_position=False,
-                        )
-
-                        channel_data[channel] = pd.concat(
-                            [
-                                channel_data[channel],
-                                pd.DataFrame(
-                                    {
-                                        "smartphone": [smartphone],
-                                        "app": [app],
-                                        "iso": [iso],
-                                        "expot": [expot],
-                                        "SNR": [snr],
-                                        "Signal": [signal],
-                                        "Noise": [noise],
-                                    }
-                                ),
-                            ]
-                        )
-
-                else:
-                    snr, signal, noise, _, _ = calc_SNR(
-                        img, center, radius, show_sample_position=False
-                    )
-
-                    data = pd.concat(
-                        [
-                            data,
-                            pd.DataFrame(
-                                {
-                                    "smartphone": [smartphone],
-                                    "app": [app],
-                                    "iso": [iso],
-                                    "expot": [expot],
-                                    "SNR": [snr],
-                                    "Signal": [signal],
-                                    "Noise": [noise],
-                                }
-                            ),
-                        ]
-                    )
-
-    if (channel_wise and not any(channel_data[0].any())) or (
-        not channel_wise and not any(data.any())
-    ):
+    img = load_image(img_path, bit_depth=16)
+
+    if channel_wise:
+        metrics = []
+        for channel in range(3):
+            snr, signal, noise, _, _ = calc_SNR(
+                img[:, :, channel],
+                center,
+                radius,
+                offset_background=offset,
+                show_sample_position=False,
+            )
+            metrics.append((snr, signal, noise))
+        return metrics
+
+    snr, signal, noise, _, _ = calc_SNR(img, center, radius, show_sample_position=False)
+    return [(snr, signal, noise)]
+
+
+def scan_dataset(
+    input_dir: str,
+    jobs: list[tuple],
+    sinks: list[ResultsSink],
+    channel_wise: bool,
+    offset: int,
+    n_workers: int = None,
+) -> None:
+    """
+    Decode and measure all jobs on a process pool, writing the rows to one results sink per
+    channel if channel_wise, else to a single sink. Files whose rows are already in all
+    sinks (e.g. of an interrupted run) are skipped; if only some sinks have a file's row, the
+    file is measured again and only the missing rows are added.
+    """
+    n_workers = default_n_workers() if n_workers is None else max(1, n_workers)
+
+    def relative_path(job: tuple) -> str:
+        return os.path.relpath(job[0], input_dir)
+
+    # a crash can leave a file's row in some channel sinks only, such files are measured again
+    jobs = [
+        job for job in jobs if not all(sink.done(relative_path(job)) for sink in sinks)
+    ]
+
+    tasks = ((job, channel_wise, offset) for job in jobs)
+    start = time.perf_counter()
+    progress = tqdm(
+        zip(jobs, bounded_imap(_measure_job, tasks, n_workers)),
+        desc="Processing frames",
+        total=len(jobs),
+    )
+    # frames and busy time per worker process
+    worker_frames, worker_seconds = {}, {}
+    for i, (job, (metrics, pid, seconds)) in enumerate(progress):
+        worker_frames[pid] = worker_frames.get(pid, 0) + 1
+        worker_seconds[pid] = worker_seconds.get(pid, 0.0) + seconds
+        _, smartphone, app, iso, expot, _, _ = job
+        for sink, (snr, signal, noise) in zip(sinks, metrics):
+            if sink.done(relative_path(job)):
+                continue
+            sink.append(
+                smartphone=smartphone,
+                app=app,
+                iso=iso,
+                expot=expot,
+                SNR=snr,
+                Signal=signal,
+                Noise=noise,
+                file=relative_path(job),
+            )
+
+        frames_per_second = (i + 1) / (time.perf_counter() - start)
+        progress.set_postfix(frames_per_s=f"{frames_per_second:.2f}")
+
+    elapsed = time.perf_counter() - start
+    if jobs:
+        # measured per worker: frames over the time the worker spent on them
+        per_worker = [
+            worker_frames[pid] / worker_seconds[pid]
+            for pid in worker_frames
+            if worker_seconds[pid] > 0
+        ]
+        print(
+            f"Processed {len(jobs)} frames in {elapsed:.1f} s with {n_workers} workers "
+            f"({len(jobs) / elapsed:.2f} frames/s; {len(worker_frames)} workers busy, "
+            f"{min(per_worker, default=0):.2f} to {max(per_worker, default=0):.2f} "
+            f"frames/s each, frames per worker {sorted(worker_frames.values())})"
+        )
+
+
+@click.command()
+@input_dir_option
+@channel_wise_option
+@offset_option
+@n_workers_option
+@resume_option
+def compare_native_to_custom(
+    input_dir: str,
+    channel_wise: bool,
+    offset: int,
+    n_workers: int = None,
+    resume: bool = False,
+) -> pd.DataFrame:
+    """
+    Calculate SNR metrics for all images in a set of ISO and exposure time settings for both custom and native camera apps.
+
+    Images are expected in the following folder structure:
+    - input_dir: Root folder for a specific smartphone.
+    - custom: Subfolder containing images taken with the custom camera app.
+    - native: Subfolder containing images taken with the native camera app.
+        - Each of these subfolders (custom and native) contains subfolders named in the format isoXexpoY,
+        where X represents the ISO value and Y represents the exposure time.
+        - Each isoXexpoY subfolder contains the images taken at the corresponding ISO and exposure time setting.
+
+    All images are decoded and measured in parallel on n_workers processes. Results are
+    written to the csv files as they come in; with resume, an interrupted run continues where
+    it stopped (if center, radius and offset are unchanged).
+    """
+    jobs, iso_expot_pairs, smartphone = enumerate_jobs(input_dir)
+
+    if len(jobs) == 0:
         print("No data collected, check input directory.")
         return
 
+    if channel_wise:
+        output_paths_csv = [
+            f"{input_dir}/channel{channel}/SNR_data_16bit.csv" for channel in range(3)
+        ]
+    else:
+        output_paths_csv = [input_dir + "/SNR_data_16bit.csv"]
+
+    params = {
+        "offset": offset,
+        "centers": CENTERS_NCC[smartphone],
+        "radius": RADII_NCC[smartphone],
+    }
+    sinks = [
+        ResultsSink(path, COLUMNS, key="file", resume=resume, params=params)
+        for path in output_paths_csv
+    ]
+    try:
+        scan_dataset(input_dir, jobs, sinks, channel_wise, offset, n_workers)
+    finally:
+        for sink in sinks:
+            sink.close()
+
+    tables = [sink.to_dataframe() for sink in sinks]
+    for output_path_csv in output_paths_csv:
+        print(f"Saved csv to {output_path_csv}")
+
+    if channel_wise:
+        channel_data = tables
+    else:
+        data = tables[0]
+
     if channel_wise:
         for channel in range(3):
             output_folder = f"{input_dir}/channel{channel}"
             os.makedirs(output_folder, exist_ok=True)
 
-            output_path_csv = f"{output_folder}/SNR_data_16bit.csv"
-            channel_data[channel].to_csv(output_path_csv, index=False)
-            print(f"Saved csv to {output_path_csv}")
-
             # plot comparison
             plot_comparison_folder = f"{output_folder}/plot_comparison"
             os.makedirs(plot_comparison_folder, exist_ok=True)
@@ -378,10 +465,6 @@ def compare_native_to_custom(
                 )
 
     else:
-        output_path_csv = input_dir + "/SNR_data_16bit.csv"
-        data.to_csv(output_path_csv, index=False)
-        print(f"Saved csv to {output_path_csv}")
-
         # plot comparison
         for iso, expot in iso_expot_pairs:
             output_path = (
@@ -5,7 +5,8 @@ import numpy as np
 import re
 
 from metrics.SNR_metrics import calc_SNR
-from helpers.helpers import load_dngs_from_folder_16bit
+from helpers.helpers import load_images_from_folder
+from metrics.results_sink import ResultsSink
 
 
 def extract_iso_expo(filename):
@@ -63,13 +64,13 @@ phone_name = "Xioami 13 Pro"
 #output_pgf = input_path + "/" + phone_name + "_metrics_complete2.pgf"
 output_png = input_path + "/" + phone_name + "_metrics_complete_16bit.png"
 
-df_images = pd.DataFrame(columns=["iso", "exposure_time"])
+results = ResultsSink(None, ["iso", "exposure_time", "SNR", "Signal", "Noise"])
 
 #center = (1450, 2030)  # Huawei P20
 center =(1540, 2080)    # Xiaomi
 radius = 80
 
-images, filenames = load_dngs_from_folder_16bit(input_path)
+images, filenames = load_images_from_folder(input_path, file_format="dng", bit_depth=16)
 for i, image in enumerate(images):
     image = np.rot90(image, 3)
     iso, expo = extract_iso_expo(filenames[i])
@@ -78,20 +79,9 @@ for i, image in enumerate(images):
         image, center, radius, show_sample_position=False
     )
 
-    df_images = pd.concat(
-        [
-            df_images,
-            pd.DataFrame(
-                {
-                    "iso": [iso],
-                    "exposure_time": [expo],
-                    "SNR": [snr],
-                    "Signal": [signal],
-                    "Noise": [noise],
-                }
-            ),
-        ]
-    )
+    results.append(iso=iso, exposure_time=expo, SNR=snr, Signal=signal, Noise=noise)
+
+df_images = results.to_dataframe()
 
 fig = plt.figure(figsize=(15, 10))
 fig.suptitle(phone_name, fontsize=24)
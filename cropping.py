@@ -1,44 +1,144 @@
 import os
-from PIL import Image
-from tqdm import tqdm
+from typing import Iterator
 import click
 import numpy as np
+import tifffile
 
-from helpers.helpers import load_images_from_folder
-from helpers.CLI_options import input_dir_option, is_raw_option, crop_factor_option
+from helpers.helpers import (
+    iter_images_from_folder,
+    list_image_files,
+    save_tiff_16bit,
+)
+from helpers.parallel import bounded_imap
+from helpers.CLI_options import (
+    input_dir_option,
+    is_raw_option,
+    crop_factor_option,
+    bayer_option,
+    n_workers_option,
+    multipage_option,
+)
 
 
-def crop(input_dir: str, is_raw: bool, crop_factor: int) -> list[str]:
+def iter_cropped_frames(
+    input_dir: str,
+    is_raw: bool,
+    crop_factor: int,
+    n_workers: int = None,
+    bayer: bool = False,
+) -> Iterator[tuple[str, np.ndarray]]:
+    """
+    Yield (filename, central square as uint16) for every image, RAW images with one channel per
+    color (R, G, B or, with bayer, R, G1, G2, B).
+    """
+    file_format = "dng" if is_raw else "tiff"
+    frames = iter_images_from_folder(
+        input_dir,
+        file_format=file_format,
+        bit_depth=16,
+        n_workers=n_workers,
+        bayer=is_raw and bayer,
+        crop_factor=crop_factor,
+    )
+    for filename, image in frames:
+        if image.dtype != np.uint16:
+            image = image.astype(np.uint16)
+        yield filename, image
+
+
+def _save_task(task: tuple[np.ndarray, str]) -> None:
+    image, file_path = task
+    save_tiff_16bit(image, file_path)
+
+
+def _frame_planes(image: np.ndarray, is_raw: bool) -> list[np.ndarray]:
+    # RAW images are saved per channel
+    if is_raw:
+        return [image[:, :, channel] for channel in range(image.shape[2])]
+    return [image]
+
+
+def crop(
+    input_dir: str,
+    is_raw: bool,
+    crop_factor: int,
+    n_workers: int = None,
+    bayer: bool = False,
+    multipage: bool = False,
+) -> list[str]:
+    """
+    Crop the central square of every image and save it as 16-bit TIFF.
+    RAW images are saved per channel (R, G, B or, with bayer, R, G1, G2, B) into channel_<c> subfolders.
+    Frames are decoded and cropped on a process pool and written on a thread pool, with at most
+    2 * n_workers frames in flight at each step.
+    - multipage: write all frames of a channel into one multi-page TIFF (channel_<c>.tiff or
+      cropped.tiff) instead of one file per frame. The pages are stored contiguously, so the
+      file is read as one memory-mapped stack (see helpers.frame_stack.load_frames).
+    """
     output_path = input_dir + "/cropped" + str(crop_factor)
     if not os.path.exists(output_path):
         os.makedirs(output_path)
 
-    file_format = "dng" if is_raw else "tiff"
-    images, filenames = load_images_from_folder(
-        input_dir, file_format=file_format, bit_depth=16
-    )
+    frames = iter_cropped_frames(input_dir, is_raw, crop_factor, n_workers, bayer)
+    if multipage:
+        n_frames = len(list_image_files(input_dir, "dng" if is_raw else "tiff"))
+        return _crop_multipage(frames, output_path, is_raw, n_frames)
 
-    for i, image in tqdm(enumerate(images), desc="Cropping images", total=len(images)):
-        if image.dtype != np.uint16:
-            image = image.astype(np.uint16)
-        square_size = int(min(image.shape[0], image.shape[1]) / crop_factor)
-        start_x = image.shape[1] // 2 - square_size // 2
-        start_y = image.shape[0] // 2 - square_size // 2
-        image = image[start_y : start_y + square_size, start_x : start_x + square_size]
-
-        if is_raw:
-            # iterate over channels and save them separately
-            for channel in range(3):
-                os.makedirs(output_path + f"/channel_{channel}", exist_ok=True)
-                im_channel = image[:, :, channel]
-                im = Image.fromarray(im_channel.astype(np.uint16), mode="I;16")
-                im.save(
-                    output_path + f"/channel_{channel}/cropped_{i + 1}.tiff",
-                    format="TIFF",
+    filenames = []
+
+    def tasks():
+        for i, (filename, image) in enumerate(frames):
+            filenames.append(filename)
+            planes = _frame_planes(image, is_raw)
+            for channel, plane in enumerate(planes):
+                if is_raw:
+                    os.makedirs(output_path + f"/channel_{channel}", exist_ok=True)
+                    yield plane, output_path + f"/channel_{channel}/cropped_{i + 1}.tiff"
+                else:
+                    yield plane, output_path + f"/cropped_{i + 1}.tiff"
+
+    for _ in bounded_imap(_save_task, tasks(), n_workers, use_threads=True):
+        pass
+
+    return filenames
+
+
+def _crop_multipage(
+    frames: Iterator[tuple[str, np.ndarray]],
+    output_path: str,
+    is_raw: bool,
+    n_frames: int,
+) -> list[str]:
+    filenames = []
+    writers = []
+    try:
+        for i, (filename, image) in enumerate(frames):
+            filenames.append(filename)
+            planes = _frame_planes(image, is_raw)
+            if not writers:
+                names = [f"channel_{c}.tiff" for c in range(len(planes))]
+                if not is_raw:
+                    names = ["cropped.tiff"]
+                # classic TIFFs are limited to 4 GB
+                bigtiff = n_frames * planes[0].nbytes > 2**32 - 2**25
+                writers = [
+                    tifffile.TiffWriter(
+                        os.path.join(output_path, name), bigtiff=bigtiff
+                    )
+                    for name in names
+                ]
+
+            for writer, plane in zip(writers, planes):
+                writer.write(
+                    plane.astype(np.uint16),
+                    contiguous=True,
+                    metadata={
+                        "filenames": [f"cropped_{j + 1}.tiff" for j in range(n_frames)]
+                    },
                 )
-        else:
-            im = Image.fromarray(image, mode="I;16")
-            im.save(output_path + f"/cropped_{i + 1}.tiff", format="TIFF")
+    finally:
+        for writer in writers:
+            writer.close()
 
     return filenames
 
@@ -47,9 +147,19 @@ def crop(input_dir: str, is_raw: bool, crop_factor: int) -> list[str]:
 @input_dir_option
 @is_raw_option
 @crop_factor_option
-def cli_crop(input_dir: str, is_raw: bool, crop_factor: int):
-    crop(input_dir, is_raw, crop_factor)
+@bayer_option
+@n_workers_option
+@multipage_option
+def cli_crop(
+    input_dir: str,
+    is_raw: bool,
+    crop_factor: int,
+    bayer: bool,
+    n_workers: int,
+    multipage: bool = False,
+):
+    crop(input_dir, is_raw, crop_factor, n_workers, bayer, multipage)
 
 
 if __name__ == "__main__":
-    crop()
+    cli_crop()
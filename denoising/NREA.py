@@ -1,33 +1,40 @@
+from typing import Iterable, Iterator
+
 import cv2
 import numpy as np
 from tqdm import tqdm
 
+from denoising.lowpass import circular_average, select_backend
+from metrics.SNR_metrics import calc_SNR
+from helpers.instrumentation import instrumented
+
 
+def to_grayscale(image: np.ndarray) -> np.ndarray:
+    if len(image.shape) == 2 or image.shape[2] == 1:
+        return image
+    elif image.shape[2] == 3:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    else:
+        raise ValueError(f"Image has shape {image.shape}")
+
+
+@instrumented()
 def NREA_transform(
     image: np.ndarray,
     gaussian_blurring: bool = False,
     kernel_radius: int = 50,
+    backend: str = "auto",
 ) -> np.ndarray:
-    global done
+    """
+    - backend: circular averaging backend, see denoising.lowpass.circular_average
+    """
 
     # CONVERT TO GRAYSCALE
-    if len(image.shape) == 2 or image.shape[2] == 1:
-        gray = image
-    elif image.shape[2] == 3:
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    else:
-        raise ValueError(f"Image has shape {image.shape}")
+    gray = to_grayscale(image)
 
     if not gaussian_blurring:
         # CIRCULAR AVERAGING
-        kernel_size = 2 * kernel_radius + 1
-        y, x = np.ogrid[:kernel_size, :kernel_size]
-        kernel_center = (kernel_radius, kernel_radius)
-        mask = (x - kernel_center[0]) ** 2 + (
-            y - kernel_center[1]
-        ) ** 2 <= kernel_radius**2
-
-        lp_filtered = cv2.filter2D(gray, -1, mask.astype(np.float32) / mask.sum())
+        lp_filtered, _ = circular_average(gray, kernel_radius, backend)
 
     else:
         # GAUSSIAN BLURRING
@@ -43,30 +50,108 @@ def NREA_transform(
     return nrea
 
 
+class NREAAccumulator:
+    """
+    Incremental NREA: every pushed frame is transformed exactly once and added to a running sum,
+    so the accumulated image after each of n frames costs n transforms in total instead of n^2 / 2.
+    """
+
+    def __init__(
+        self, gaussian_blurring: bool, kernel_radius: int, backend: str = "auto"
+    ):
+        self.gaussian_blurring = gaussian_blurring
+        self.kernel_radius = kernel_radius
+        self.backend = backend
+        self.n_images = 0
+        self.sum = None
+
+    def add(self, image: np.ndarray) -> None:
+        """Transform a frame and add it to the running sum."""
+        if not self.gaussian_blurring and self.backend == "auto":
+            self.backend = select_backend(image.shape[:2], self.kernel_radius)
+
+        transformed_image = NREA_transform(
+            image, self.gaussian_blurring, self.kernel_radius, self.backend
+        )
+        self.add_transformed(transformed_image)
+
+    def add_transformed(self, transformed_image: np.ndarray) -> None:
+        """Add a frame that was already transformed with NREA_transform."""
+        if self.sum is None:
+            self.sum = np.zeros(transformed_image.shape, dtype=np.float64)
+        self.sum += transformed_image
+        self.n_images += 1
+
+    def push(self, image: np.ndarray) -> np.ndarray:
+        """Add a frame and return the accumulated image of all frames pushed so far."""
+        self.add(image)
+
+        return self.accumulated_image()
+
+    def accumulated_image(self) -> np.ndarray:
+        # NORMALIZATION
+        accumulated_image = self.sum.copy()
+        if accumulated_image.min() < 0:
+            accumulated_image += abs(accumulated_image.min())
+
+        accumulated_image = accumulated_image.astype(np.uint16)
+
+        # accumulated_image_normalized = (
+        #     (accumulated_image - accumulated_image.min())
+        #     / (accumulated_image.max() - accumulated_image.min())
+        #     * 255
+        # )
+        # accumulated_image_normalized = accumulated_image_normalized.astype(np.uint8)
+
+        return accumulated_image
+
+    def snr(
+        self, center: tuple[int, int], radius: int, offset_background: int = None
+    ) -> tuple[float, float, float, float, float]:
+        """SNR metrics of the current accumulated image, see metrics.SNR_metrics.calc_SNR."""
+        return calc_SNR(
+            self.accumulated_image(),
+            center,
+            radius,
+            offset_background=offset_background,
+        )
+
+
+def NREA_frames(
+    images: Iterable[np.ndarray],
+    gaussian_blurring: bool,
+    kernel_radius: int,
+    accumulate: bool = True,
+    normalize: bool = False,
+) -> Iterator[np.ndarray]:
+    """
+    NREA image after each frame of a sequence, every frame is transformed only once.
+    - accumulate: the i-th result accumulates frames 0..i, otherwise only frame i is used
+    - normalize: stretch every result to the range 0..2^16
+    """
+    accumulator = NREAAccumulator(gaussian_blurring, kernel_radius)
+    for image in images:
+        if not accumulate:
+            accumulator = NREAAccumulator(gaussian_blurring, kernel_radius)
+        nrea = accumulator.push(image)
+
+        if normalize:
+            nrea = ((nrea - np.min(nrea)) / (np.max(nrea) - np.min(nrea))) * 2**16
+        yield nrea
+
+
 def NREA(
-    images: list[np.ndarray],
+    images: list[np.ndarray] | np.ndarray,
     gaussian_blurring: bool,
     kernel_radius: int,
+    backend: str = "auto",
 ):
-    tranformed_images = []
-    for image in tqdm(images, desc="Running NREA transform"):
-        transformed_image = NREA_transform(image, gaussian_blurring, kernel_radius)
-        tranformed_images.append(transformed_image)
-
     # ACCUMULATION
-    accumulated_image = np.sum(tranformed_images, axis=0)
-
-    # NORMALIZATION
-    if accumulated_image.min() < 0:
-        accumulated_image += abs(accumulated_image.min())
-
-    accumulated_image = accumulated_image.astype(np.uint16)
-
-    # accumulated_image_normalized = (
-    #     (accumulated_image - accumulated_image.min())
-    #     / (accumulated_image.max() - accumulated_image.min())
-    #     * 255
-    # )
-    # accumulated_image_normalized = accumulated_image_normalized.astype(np.uint8)
-
-    return accumulated_image
+    accumulator = NREAAccumulator(gaussian_blurring, kernel_radius, backend)
+    progress = tqdm(images, desc="Running NREA transform")
+    for image in progress:
+        accumulator.add(image)
+        if not gaussian_blurring:
+            progress.set_postfix(backend=accumulator.backend)
+
+    return accumulator.accumulated_image()
@@ -0,0 +1,106 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+
+import cv2
+import numpy as np
+from tqdm import tqdm
+
+from denoising.NREA import NREAAccumulator, to_grayscale
+from denoising.lowpass import (
+    circular_average,
+    select_backend,
+    frame_spectrum,
+    filter_spectrum,
+    round_to_dtype,
+)
+from helpers.parallel import default_n_workers
+
+
+def _circular_average_from_spectrum(
+    gray: np.ndarray, spectrum_data: tuple, kernel_radius: int
+) -> np.ndarray:
+    spectrum, shape, pad = spectrum_data
+    filtered = filter_spectrum(spectrum, shape, gray.shape, pad, kernel_radius)
+    return round_to_dtype(filtered, gray.dtype)
+
+
+def _transform_and_add(
+    accumulator: NREAAccumulator, gray: np.ndarray, spectrum_data: tuple
+) -> None:
+    kernel_radius = accumulator.kernel_radius
+
+    if accumulator.gaussian_blurring:
+        # GAUSSIAN BLURRING
+        kernel = (2 * kernel_radius + 1, 2 * kernel_radius + 1)
+        sigma = kernel_radius / 3
+        lp_filtered = cv2.GaussianBlur(gray, kernel, sigma)
+    elif accumulator.backend == "fft":
+        # CIRCULAR AVERAGING, sharing the frame's spectrum with the other FFT radii
+        lp_filtered = _circular_average_from_spectrum(
+            gray, spectrum_data, kernel_radius
+        )
+    else:
+        # CIRCULAR AVERAGING
+        lp_filtered, _ = circular_average(gray, kernel_radius, accumulator.backend)
+
+    # COMPENSATION
+    accumulator.add_transformed(lp_filtered - np.mean(lp_filtered))
+
+
+def NREA_sweep(
+    images: Iterable[np.ndarray],
+    kernel_radii: list[int],
+    gaussian_blurring: tuple[bool, ...] = (False, True),
+    n_workers: int = None,
+) -> dict[tuple[bool, int], np.ndarray]:
+    """
+    Run NREA for several kernel radii and filters in a single pass over the frames.
+
+    Every frame is converted to grayscale once. For circular averaging radii that use the FFT
+    backend (see denoising.lowpass.select_backend) the spectrum of the padded frame is computed
+    once and shared by all of them (see denoising.lowpass.filter_spectrum). The filter variants
+    of a frame run concurrently on a thread pool (OpenCV and scipy.fft release the GIL).
+    Frames are consumed one at a time, so images can be an iterator.
+
+    Results match NREA per radius up to the +/- 1 rounding differences between low-pass backends.
+
+    Returns:
+    dict mapping (gaussian_blurring, kernel_radius) to the accumulated image.
+    """
+    n_workers = default_n_workers() if n_workers is None else max(1, n_workers)
+
+    accumulators = {
+        (gb, kernel_radius): NREAAccumulator(gb, kernel_radius)
+        for gb in gaussian_blurring
+        for kernel_radius in kernel_radii
+    }
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        for image in tqdm(images, desc="Running NREA sweep"):
+            # CONVERT TO GRAYSCALE
+            gray = to_grayscale(image)
+
+            # radii for which the FFT backend is the fastest share the spectrum of the frame
+            for (gb, kernel_radius), accumulator in accumulators.items():
+                if not gb and accumulator.backend == "auto":
+                    accumulator.backend = select_backend(gray.shape, kernel_radius)
+            fft_radii = [
+                kernel_radius
+                for (gb, kernel_radius), accumulator in accumulators.items()
+                if not gb and accumulator.backend == "fft"
+            ]
+
+            spectrum_data = None
+            if fft_radii:
+                pad = max(fft_radii)
+                spectrum, shape = frame_spectrum(gray, pad)
+                spectrum_data = (spectrum, shape, pad)
+
+            futures = [
+                executor.submit(_transform_and_add, accumulator, gray, spectrum_data)
+                for accumulator in accumulators.values()
+            ]
+            for future in futures:
+                future.result()
+
+    return {key: acc.accumulated_image() for key, acc in accumulators.items()}
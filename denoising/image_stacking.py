@@ -1,13 +1,167 @@
+import os
+import tempfile
+from typing import Iterable
+
 import numpy as np
 
+from helpers.frame_stack import spool_frames
+
+# memory budget of one row band in median_stacking
+DEFAULT_CHUNK_BYTES = 64 * 2**20
+
+
+def mean_stacking(images: Iterable[np.ndarray] | np.ndarray) -> np.ndarray:
+    """
+    Arithmetic mean of the frames, accumulated frame by frame in float64.
+    images can be a list, an (N, H, W[, C]) array or memmap, or an iterator of frames.
+    """
+    mean_image = None
+    n_images = 0
+    for image in images:
+        if mean_image is None:
+            mean_image = np.zeros(image.shape, dtype=np.float64)
+        mean_image += image
+        n_images += 1
 
-def mean_stacking(images: list[np.ndarray]) -> np.ndarray:
-    mean_image = np.sum(images, axis=0) / len(images)
+    mean_image /= n_images
 
     return mean_image
 
 
-def median_stacking(images: list[np.ndarray]) -> np.ndarray:
-    median_image = np.median(images, axis=0)
+def _row_bands(images, chunk_bytes: int):
+    # row bands of about chunk_bytes for the whole (N, rows, ...) stack, in float64
+    n_images, height = len(images), images[0].shape[0]
+    row_bytes = n_images * images[0][0].size * np.dtype(np.float64).itemsize
+    rows = max(1, chunk_bytes // row_bytes)
+    for y in range(0, height, rows):
+        yield slice(y, min(y + rows, height))
+
+
+def _band(images, rows: slice) -> np.ndarray:
+    if isinstance(images, np.ndarray):
+        return images[:, rows]
+    return np.stack([image[rows] for image in images])
+
+
+def _stack_in_bands(images, chunk_bytes: int, kernel) -> np.ndarray:
+    # apply kernel (reducing the frame axis) to row bands of the stack
+    if not isinstance(images, (np.ndarray, list, tuple)):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            frames = spool_frames(images, os.path.join(tmp_dir, "frames.raw"))
+            stacked_image = _stack_in_bands(frames, chunk_bytes, kernel)
+            del frames
+        return stacked_image
+
+    stacked_image = np.empty(images[0].shape, dtype=np.float64)
+    for rows in _row_bands(images, chunk_bytes):
+        stacked_image[rows] = kernel(_band(images, rows))
+
+    return stacked_image
+
+
+def median_stacking(
+    images: Iterable[np.ndarray] | np.ndarray, chunk_bytes: int = DEFAULT_CHUNK_BYTES
+) -> np.ndarray:
+    """
+    Per-pixel median of the frames, computed in row bands so that only one band of the
+    whole stack is held in memory at a time.
+    images can be a list, an (N, H, W[, C]) array or memmap, or an iterator of frames;
+    iterators are spooled to a temporary file first.
+    - chunk_bytes: approximate memory budget of one band
+    """
+    return _stack_in_bands(images, chunk_bytes, lambda band: np.median(band, axis=0))
+
+
+def _sigma_clipped_mean(band: np.ndarray, sigma: float, max_iters: int) -> np.ndarray:
+    band = band.astype(np.float64)
+    keep = np.ones(band.shape, dtype=bool)
+    for _ in range(max_iters):
+        n = keep.sum(axis=0)
+        mean = np.where(keep, band, 0).sum(axis=0) / n
+        deviation = band - mean
+        std = np.sqrt(np.where(keep, deviation**2, 0).sum(axis=0) / n)
+
+        new_keep = np.abs(deviation) <= sigma * std
+        if np.array_equal(new_keep, keep):
+            break
+        keep = new_keep
+
+    return np.where(keep, band, 0).sum(axis=0) / keep.sum(axis=0)
+
+
+def _n_trimmed(n_images: int, proportion: float) -> int:
+    n_trimmed = int(proportion * n_images)
+    if 2 * n_trimmed >= n_images:
+        raise ValueError(
+            f"Cannot trim {n_trimmed} frames from each end of {n_images} frames"
+        )
+    return n_trimmed
+
+
+def _trimmed_mean(band: np.ndarray, proportion: float) -> np.ndarray:
+    n_images = band.shape[0]
+    k = _n_trimmed(n_images, proportion)
+    band = np.partition(band, (k, n_images - k - 1), axis=0)
+
+    return band[k : n_images - k].sum(axis=0, dtype=np.float64) / (n_images - 2 * k)
+
+
+def _winsorized_mean(band: np.ndarray, proportion: float) -> np.ndarray:
+    n_images = band.shape[0]
+    k = _n_trimmed(n_images, proportion)
+    band = np.partition(band, (k, n_images - k - 1), axis=0)
+
+    # the k lowest and highest values are replaced by the k-th lowest and highest
+    total = band[k : n_images - k].sum(axis=0, dtype=np.float64)
+    total += k * band[k].astype(np.float64)
+    total += k * band[n_images - k - 1].astype(np.float64)
+
+    return total / n_images
+
+
+def sigma_clipped_mean_stacking(
+    images: Iterable[np.ndarray] | np.ndarray,
+    sigma: float = 3.0,
+    max_iters: int = 5,
+    chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+) -> np.ndarray:
+    """
+    Per-pixel mean after iteratively rejecting values further than sigma standard deviations
+    from the mean of the remaining values (e.g. hot pixels or cosmic-ray hits).
+    Computed in row bands like median_stacking.
+    - sigma: rejection threshold in standard deviations
+    - max_iters: maximum number of rejection iterations
+    """
+    return _stack_in_bands(
+        images, chunk_bytes, lambda band: _sigma_clipped_mean(band, sigma, max_iters)
+    )
+
+
+def trimmed_mean_stacking(
+    images: Iterable[np.ndarray] | np.ndarray,
+    proportion: float = 0.1,
+    chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+) -> np.ndarray:
+    """
+    Per-pixel mean without the lowest and highest proportion of values.
+    Computed in row bands like median_stacking, using a partial sort instead of a full one.
+    - proportion: fraction of frames cut from each end
+    """
+    return _stack_in_bands(
+        images, chunk_bytes, lambda band: _trimmed_mean(band, proportion)
+    )
+
 
-    return median_image
+def winsorized_mean_stacking(
+    images: Iterable[np.ndarray] | np.ndarray,
+    proportion: float = 0.1,
+    chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+) -> np.ndarray:
+    """
+    Per-pixel mean with the lowest and highest proportion of values clamped to the
+    remaining extremes. Computed in row bands like trimmed_mean_stacking.
+    - proportion: fraction of frames clamped at each end
+    """
+    return _stack_in_bands(
+        images, chunk_bytes, lambda band: _winsorized_mean(band, proportion)
+    )
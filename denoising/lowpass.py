@@ -0,0 +1,176 @@
+import math
+from functools import lru_cache
+
+import cv2
+import numpy as np
+import scipy.fft
+
+BACKENDS = ("spatial", "fft", "sat")
+
+# cv2.filter2D switches to a DFT internally for large kernels, but its transform size grows with
+# the kernel. From this radius on (and for frames of at least FFT_MIN_PIXELS) the FFT backend
+# with its cached kernel spectra is faster and its cost no longer depends on the radius.
+FFT_MIN_RADIUS = 150
+FFT_MIN_PIXELS = 1_000_000
+
+# a cached kernel spectrum is about as large as the complex spectrum of a frame (~100 MB at
+# 12 MP), a few entries cover the FFT radii used together (e.g. in denoising.NREA_sweep)
+SPECTRUM_CACHE_SIZE = 4
+
+
+def disk_kernel(kernel_radius: int) -> np.ndarray:
+    """Normalized (2r+1)^2 disk kernel as used for circular averaging."""
+    kernel_size = 2 * kernel_radius + 1
+    y, x = np.ogrid[:kernel_size, :kernel_size]
+    kernel_center = (kernel_radius, kernel_radius)
+    mask = (x - kernel_center[0]) ** 2 + (y - kernel_center[1]) ** 2 <= kernel_radius**2
+
+    return mask.astype(np.float32) / mask.sum()
+
+
+def disk_bands(kernel_radius: int) -> list[tuple[int, int, int]]:
+    """
+    Decompose the disk into horizontal bands of equal half-width.
+
+    Returns:
+    list of (dy_start, dy_end, half_width): rows dy_start..dy_end (inclusive, relative to the center)
+    cover the columns -half_width..half_width.
+    """
+    bands = []
+    for dy in range(-kernel_radius, kernel_radius + 1):
+        half_width = math.isqrt(kernel_radius**2 - dy**2)
+        if bands and bands[-1][2] == half_width:
+            bands[-1] = (bands[-1][0], dy, half_width)
+        else:
+            bands.append((dy, dy, half_width))
+
+    return bands
+
+
+def select_backend(shape: tuple[int, int], kernel_radius: int) -> str:
+    """Pick the fastest circular averaging backend for an image shape and kernel radius."""
+    if (
+        kernel_radius >= FFT_MIN_RADIUS
+        and shape[0] * shape[1] >= FFT_MIN_PIXELS
+        and min(shape) > 2 * kernel_radius
+    ):
+        return "fft"
+
+    return "spatial"
+
+
+def reflect_pad(image: np.ndarray, pad: int) -> np.ndarray:
+    """Pad with the same border mode (BORDER_REFLECT_101) cv2.filter2D uses."""
+    return cv2.copyMakeBorder(image, pad, pad, pad, pad, cv2.BORDER_REFLECT_101)
+
+
+def fft_shape(padded_shape: tuple[int, int]) -> tuple[int, int]:
+    return tuple(scipy.fft.next_fast_len(s, real=True) for s in padded_shape)
+
+
+@lru_cache(maxsize=SPECTRUM_CACHE_SIZE)
+def disk_spectrum(shape: tuple[int, int], kernel_radius: int) -> np.ndarray:
+    """Spectrum of the disk kernel for FFTs of the given shape (cached per shape and radius)."""
+    kernel_size = 2 * kernel_radius + 1
+    kernel = np.zeros(shape, dtype=np.float64)
+    kernel[:kernel_size, :kernel_size] = disk_kernel(kernel_radius)
+
+    return scipy.fft.rfft2(kernel, workers=-1)
+
+
+def frame_spectrum(image: np.ndarray, pad: int) -> tuple[np.ndarray, tuple[int, int]]:
+    """
+    Spectrum of the reflect-padded image.
+    It can be reused for every kernel radius <= pad (see filter_spectrum).
+    """
+    padded = reflect_pad(image, pad).astype(np.float64)
+    shape = fft_shape(padded.shape)
+
+    return scipy.fft.rfft2(padded, shape, workers=-1), shape
+
+
+def filter_spectrum(
+    spectrum: np.ndarray,
+    shape: tuple[int, int],
+    image_shape: tuple[int, int],
+    pad: int,
+    kernel_radius: int,
+) -> np.ndarray:
+    """
+    Circular average (float64) from the spectrum of an image padded by pad >= kernel_radius.
+    The output pixels only depend on padded pixels within kernel_radius, so the cyclic
+    convolution does not wrap around into the result.
+    """
+    filtered = scipy.fft.irfft2(
+        spectrum * disk_spectrum(shape, kernel_radius), shape, workers=-1
+    )
+    start = pad + kernel_radius
+    return filtered[start : start + image_shape[0], start : start + image_shape[1]]
+
+
+def round_to_dtype(filtered: np.ndarray, dtype: np.dtype) -> np.ndarray:
+    """Round and saturate like cv2.filter2D does for integer output."""
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        return np.clip(np.rint(filtered), info.min, info.max).astype(dtype)
+    return filtered.astype(dtype)
+
+
+def _fft_circular_average(image: np.ndarray, kernel_radius: int) -> np.ndarray:
+    spectrum, shape = frame_spectrum(image, kernel_radius)
+    filtered = filter_spectrum(
+        spectrum, shape, image.shape, kernel_radius, kernel_radius
+    )
+    return round_to_dtype(filtered, image.dtype)
+
+
+def _sat_circular_average(image: np.ndarray, kernel_radius: int) -> np.ndarray:
+    # integral image of the padded frame, the disk is summed band by band with 4 lookups each
+    padded = reflect_pad(image, kernel_radius)
+    integral = cv2.integral(padded, sdepth=cv2.CV_64F)
+    height, width = image.shape
+
+    total = np.zeros((height, width), dtype=np.float64)
+    n_pixels = 0
+    for dy_start, dy_end, half_width in disk_bands(kernel_radius):
+        y0 = kernel_radius + dy_start
+        y1 = kernel_radius + dy_end + 1
+        x0 = kernel_radius - half_width
+        x1 = kernel_radius + half_width + 1
+        total += integral[y1 : y1 + height, x1 : x1 + width]
+        total -= integral[y0 : y0 + height, x1 : x1 + width]
+        total -= integral[y1 : y1 + height, x0 : x0 + width]
+        total += integral[y0 : y0 + height, x0 : x0 + width]
+        n_pixels += (y1 - y0) * (x1 - x0)
+
+    return round_to_dtype(total / n_pixels, image.dtype)
+
+
+def circular_average(
+    image: np.ndarray, kernel_radius: int, backend: str = "auto"
+) -> tuple[np.ndarray, str]:
+    """
+    Low-pass filter a grayscale image with a normalized disk of the given radius.
+    - backend: "spatial" (cv2.filter2D), "fft" (FFT convolution with cached kernel spectra),
+      "sat" (summed-area table over an exact band decomposition of the disk, cost grows with
+      the number of bands) or "auto" (see select_backend)
+
+    All backends use the same border handling and output dtype; integer results agree with
+    cv2.filter2D up to rounding (+/- 1).
+
+    Returns:
+    (filtered image, name of the backend used)
+    """
+    if backend == "auto":
+        backend = select_backend(image.shape[:2], kernel_radius)
+
+    if backend == "spatial":
+        filtered = cv2.filter2D(image, -1, disk_kernel(kernel_radius))
+    elif backend == "fft":
+        filtered = _fft_circular_average(image, kernel_radius)
+    elif backend == "sat":
+        filtered = _sat_circular_average(image, kernel_radius)
+    else:
+        raise ValueError(f"Unknown backend {backend}, choose one of {BACKENDS}")
+
+    return filtered, backend
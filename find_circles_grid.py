@@ -4,7 +4,7 @@ import matplotlib.pyplot as plt
 
 import click
 
-import rawpy
+from helpers.helpers import load_image
 
 
 @click.command()
@@ -21,12 +21,12 @@ def find_circles_grid(image_path, center_x, center_y, grid_cell_width):
     if not image_path.startswith("images/"):
         image_path = "images/" + image_path
 
-    if image_path.endswith(".dng"):
-        with rawpy.imread(image_path) as raw:
-            # Convert the raw data to a NumPy array (RGB)
-            image = raw.postprocess()
-    else:
-        image = cv2.imread(image_path)
+    # only decode the region around the 3x3 grid
+    half_size = 2 * grid_cell_width
+    window_x = max(center_x - half_size, 0)
+    window_y = max(center_y - half_size, 0)
+    window = (window_x, window_y, 2 * half_size, 2 * half_size)
+    image = load_image(image_path, window=window)
 
     image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
 
@@ -53,6 +53,11 @@ def find_circles_grid(image_path, center_x, center_y, grid_cell_width):
         maxRadius=140,
     )
 
+    # window to full-frame coordinates
+    if circles is not None:
+        circles[0, :, 0] += window_x
+        circles[0, :, 1] += window_y
+
     # Print the detected circles
     print("Detected circles:", circles)
 
@@ -74,7 +79,7 @@ def find_circles_grid(image_path, center_x, center_y, grid_cell_width):
 
     for row in detected_grid:
         for x, y in row:
-            x, y, average_r = int(x), int(y), int(average_r)
+            x, y, average_r = int(x) - window_x, int(y) - window_y, int(average_r)
             cv2.circle(image, (x, y), average_r, (0, 255, 0), 4)
             cv2.rectangle(image, (x - 70, y - 70), (x + 70, y + 70), (0, 128, 255), 10)
 
@@ -82,7 +87,7 @@ def find_circles_grid(image_path, center_x, center_y, grid_cell_width):
 
     # draw added circles
     for x, y in added_grid:
-        x, y = int(x), int(y)
+        x, y = int(x) - window_x, int(y) - window_y
         cv2.circle(image, (x, y), average_r, (0, 0, 255), 4)
         cv2.rectangle(image, (x - 70, y - 70), (x + 70, y + 70), (0, 128, 255), 10)
 
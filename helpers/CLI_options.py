@@ -1,6 +1,6 @@
+import os
 import click
 
-
 input_dir_option: click.option() = click.option(
     "--input_dir", type=str, default="images/", prompt="Path to the image folder"
 )
@@ -9,6 +9,13 @@ is_raw_option: click.option() = click.option(
     "--is_raw", type=bool, default=False, prompt="Are the images in RAW format?"
 )
 
+bayer_option: click.option() = click.option(
+    "--bayer",
+    type=bool,
+    default=False,
+    prompt="Split RAW images into Bayer planes (R, G1, G2, B) instead of demosaicing?",
+)
+
 format_option: click.option() = click.option(
     "--format",
     type=click.Choice(["dng", "tiff"], case_sensitive=False),
@@ -57,6 +64,20 @@ weight_option: click.option() = click.option(
     prompt="ROF: Weight for ROF denoising",
 )
 
+weights_option: click.option() = click.option(
+    "--weights",
+    type=str,
+    default="0.1,0.3,0.5,0.7,0.9",
+    prompt="ROF: Comma-separated weights to sweep",
+)
+
+tile_size_option: click.option() = click.option(
+    "--tile_size",
+    type=int,
+    default=0,
+    prompt="ROF: Tile size for parallel denoising of single frames (0 = whole frames)",
+)
+
 accumulate_option: click.option() = click.option(
     "--accumulate",
     type=bool,
@@ -71,9 +92,127 @@ normalize_option: click.option() = click.option(
     prompt="NREA: Normalize images?",
 )
 
+align_option: click.option() = click.option(
+    "--align",
+    type=bool,
+    default=False,
+    prompt="Register the frames to the first one before processing?",
+)
+
+clip_sigma_option: click.option() = click.option(
+    "--clip_sigma",
+    type=float,
+    default=3.0,
+    prompt="Stacking: Rejection threshold (in standard deviations) for sigma clipping",
+)
+
+trim_proportion_option: click.option() = click.option(
+    "--trim_proportion",
+    type=float,
+    default=0.1,
+    prompt="Stacking: Fraction of frames trimmed/winsorized at each end",
+)
+
 channel_wise_option: click.option() = click.option(
     "--channel_wise",
     type=bool,
     default=False,
     prompt="Calculate metrics channel-wise?",
 )
+
+n_workers_option: click.option() = click.option(
+    "--n_workers",
+    type=int,
+    default=os.cpu_count(),
+    prompt="Number of worker processes",
+)
+
+use_cache_option: click.option() = click.option(
+    "--use_cache",
+    type=bool,
+    default=True,
+    prompt="Skip pipeline stages whose inputs and parameters are unchanged?",
+)
+
+in_memory_option: click.option() = click.option(
+    "--in_memory",
+    type=bool,
+    default=False,
+    prompt="Pass frames between pipeline stages in memory instead of through TIFF files?",
+)
+
+write_intermediate_option: click.option() = click.option(
+    "--write_intermediate",
+    type=bool,
+    default=False,
+    prompt="In-memory pipeline: also save cropped, ROF and NREA frames as TIFF?",
+)
+
+profile_option: click.option() = click.option(
+    "--profile",
+    type=bool,
+    default=False,
+    prompt="Record time and memory use of the pipeline stages?",
+)
+
+cameras_option: click.option() = click.option(
+    "--cameras",
+    type=str,
+    default="OV,Arducam,Smartphone",
+    prompt="Benchmark: Comma-separated cameras of camera_configs.RESOLUTIONS",
+)
+
+n_frames_option: click.option() = click.option(
+    "--n_frames",
+    type=int,
+    default=10,
+    prompt="Benchmark: Number of synthetic frames per camera",
+)
+
+benchmarks_option: click.option() = click.option(
+    "--benchmarks",
+    type=str,
+    default="all",
+    prompt="Benchmark: Comma-separated benchmarks to run (all for every benchmark)",
+)
+
+repeats_option: click.option() = click.option(
+    "--repeats",
+    type=int,
+    default=3,
+    prompt="Benchmark: Number of timed repetitions",
+)
+
+baseline_option: click.option() = click.option(
+    "--baseline",
+    type=str,
+    default="",
+    prompt="Benchmark: Results JSON to compare with (empty for none)",
+)
+
+manifest_option: click.option() = click.option(
+    "--manifest",
+    type=str,
+    prompt="Batch: Path of the manifest of jobs (CSV or YAML)",
+)
+
+multipage_option: click.option() = click.option(
+    "--multipage",
+    type=bool,
+    default=False,
+    prompt="Save all frames of a channel into one multi-page TIFF?",
+)
+
+check_n_frames_option: click.option() = click.option(
+    "--n_frames",
+    type=int,
+    default=12,
+    prompt="Number of synthetic frames (more than 10 to cover the sort order)",
+)
+
+resume_option: click.option() = click.option(
+    "--resume",
+    type=bool,
+    default=False,
+    prompt="Continue an interrupted run (keep results already in the csv)?",
+)
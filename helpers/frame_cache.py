@@ -0,0 +1,200 @@
+import os
+import json
+import hashlib
+import tempfile
+import contextlib
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+CACHE_DIR_ENV = "IMAGE_PROCESSING_CACHE_DIR"
+CACHE_MAX_GB_ENV = "IMAGE_PROCESSING_CACHE_MAX_GB"
+DEFAULT_MAX_GB = 20.0
+# eviction frees space down to this fraction of the limit, so a full cache is not scanned again
+# on every put
+EVICT_TO_FRACTION = 0.9
+# running total of the entry sizes, shared by all processes using the cache, and its lock
+SIZE_FILENAME = "size.json"
+LOCK_FILENAME = ".lock"
+
+_default_cache = None
+
+
+class FrameCache:
+    """
+    On-disk cache for decoded frames.
+
+    Entries are keyed by the source file's path, mtime and size plus the decoding parameters
+    and stored as .npy files, so hits are returned memory-mapped instead of being decoded again.
+    The cache is bounded by max_bytes; the least recently used entries are evicted first.
+    The total size of the entries is kept in size.json in the cache directory and updated under
+    a lock file by every process writing to the cache, so the limit holds for concurrent
+    workers. The directory is only scanned when the total exceeds max_bytes (or size.json is
+    missing); eviction then frees space down to EVICT_TO_FRACTION of max_bytes.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = int(DEFAULT_MAX_GB * 2**30)):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, file_path: str, params: dict) -> str:
+        stat = os.stat(file_path)
+        description = json.dumps(
+            {
+                "path": os.path.abspath(file_path),
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "params": params,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha1(description.encode()).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".npy")
+
+    def get(self, key: str) -> np.ndarray | None:
+        path = self._entry_path(key)
+        try:
+            image = np.load(path, mmap_mode="c")
+        except (OSError, ValueError):
+            return None
+
+        # mark entry as recently used
+        try:
+            os.utime(path)
+        except OSError:  # evicted in the meantime, the mapped data stays valid
+            pass
+
+        return image
+
+    def put(self, key: str, image: np.ndarray) -> None:
+        # write to a temporary file first so concurrent readers never see partial entries
+        path = self._entry_path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, np.ascontiguousarray(image))
+            size = os.path.getsize(tmp_path)
+
+            with self._locked():
+                total_bytes = self._read_total()
+                replaced_size = os.path.getsize(path) if os.path.exists(path) else 0
+                os.replace(tmp_path, path)
+                total_bytes += size - replaced_size
+                if total_bytes > self.max_bytes:
+                    total_bytes = self._evict()
+                self._write_total(total_bytes)
+        finally:
+            if os.path.exists(tmp_path):
+                _remove(tmp_path)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Exclusive lock on the cache directory across processes."""
+        with open(os.path.join(self.cache_dir, LOCK_FILENAME), "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _read_total(self) -> int:
+        # called with the lock held, a missing or damaged size file is rebuilt from the entries
+        try:
+            with open(os.path.join(self.cache_dir, SIZE_FILENAME)) as f:
+                return int(json.load(f)["bytes"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return sum(size for _, size, _ in self._entries())
+
+    def _write_total(self, total_bytes: int) -> None:
+        path = os.path.join(self.cache_dir, SIZE_FILENAME)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"bytes": total_bytes}, f)
+        os.replace(path + ".tmp", path)
+
+    def _entries(self) -> list[tuple[float, int, str]]:
+        """(mtime, size, filename) of all entries."""
+        entries = []
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith(".npy"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, filename))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, filename))
+        return entries
+
+    def evict(self) -> None:
+        """Remove the least recently used entries if the cache exceeds max_bytes."""
+        with self._locked():
+            self._write_total(self._evict())
+
+    def _evict(self) -> int:
+        # called with the lock held, returns the size of the remaining entries
+        entries = self._entries()
+        total_bytes = sum(size for _, size, _ in entries)
+        if total_bytes <= self.max_bytes:
+            return total_bytes
+
+        for _, size, filename in sorted(entries):
+            if total_bytes <= self.max_bytes * EVICT_TO_FRACTION:
+                break
+            # entries still mapped elsewhere cannot be removed on Windows, they are kept
+            if _remove(os.path.join(self.cache_dir, filename)):
+                total_bytes -= size
+
+        return total_bytes
+
+    def clear(self) -> None:
+        with self._locked():
+            for filename in os.listdir(self.cache_dir):
+                if filename.endswith(".npy"):
+                    _remove(os.path.join(self.cache_dir, filename))
+            _remove(os.path.join(self.cache_dir, SIZE_FILENAME))
+
+
+def _remove(path: str) -> bool:
+    """Remove a file, False if it is already gone or still in use (Windows)."""
+    try:
+        os.remove(path)
+    except OSError:
+        return False
+    return True
+
+
+def get_frame_cache() -> FrameCache | None:
+    """
+    Return the frame cache configured via the environment, or None if caching is disabled.
+    - IMAGE_PROCESSING_CACHE_DIR: cache directory, caching is enabled if set
+    - IMAGE_PROCESSING_CACHE_MAX_GB: size limit in GB (default 20)
+    """
+    global _default_cache
+
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if not cache_dir:
+        return None
+
+    max_bytes = int(float(os.environ.get(CACHE_MAX_GB_ENV, DEFAULT_MAX_GB)) * 2**30)
+    if (
+        _default_cache is None
+        or _default_cache.cache_dir != cache_dir
+        or _default_cache.max_bytes != max_bytes
+    ):
+        _default_cache = FrameCache(cache_dir, max_bytes)
+
+    return _default_cache
@@ -0,0 +1,359 @@
+import os
+import json
+import tempfile
+import contextlib
+import click
+import numpy as np
+import tifffile
+from typing import Iterable, Iterator
+
+from helpers.helpers import (
+    normalize_path,
+    list_image_files,
+    iter_images_from_folder,
+    load_images_from_folder,
+)
+from helpers.registration import align_frames, SHIFTS_FILENAME
+from helpers.CLI_options import input_dir_option, is_raw_option, n_workers_option
+
+STACK_EXTENSION = ".stack"
+TIFF_EXTENSIONS = (".tif", ".tiff")
+STACK_MAGIC = b"IPSTACK1"
+HEADER_ALIGNMENT = 64
+
+
+class FrameStack:
+    """
+    A burst of frames packed into one contiguous (N, H, W[, C]) array on disk.
+
+    The file consists of a magic string, the length of a JSON header (filenames, dtype, shape,
+    source metadata) and the raw frame data, which is opened with np.memmap so that frames can
+    be processed without loading the whole burst into memory.
+    """
+
+    def __init__(
+        self, path: str, frames: np.memmap, filenames: list[str], metadata: dict
+    ):
+        self.path = path
+        self.frames = frames
+        self.filenames = filenames
+        self.metadata = metadata
+
+    def __len__(self) -> int:
+        return self.frames.shape[0]
+
+    def __getitem__(self, index) -> np.ndarray:
+        return self.frames[index]
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        return iter(self.frames)
+
+
+def is_stack(path: str) -> bool:
+    return os.path.isfile(path) and path.lower().endswith(STACK_EXTENSION)
+
+
+def is_multipage_tiff(path: str) -> bool:
+    """A single TIFF file given as frames input, e.g. channel_0.tiff written by cropping.crop with multipage."""
+    return os.path.isfile(path) and path.lower().endswith(TIFF_EXTENSIONS)
+
+
+def _tiff_frame_shape(tif: tifffile.TiffFile) -> tuple[tuple[int, ...], int]:
+    # shape of one frame and number of frames of the first series, the one that is read
+    series = tif.series[0]
+    frame_shape = series.keyframe.shape
+    n_frames = int(np.prod(series.shape[: len(series.shape) - len(frame_shape)]))
+    return frame_shape, n_frames
+
+
+def open_multipage_tiff(path: str) -> tuple[np.ndarray, list[str]]:
+    """
+    Frames of a multi-page TIFF as one (N, H, W[, C]) array and their filenames.
+    Contiguously written files are memory-mapped, others are read into memory.
+    Filenames are taken from the metadata written by cropping.crop, otherwise numbered after the file.
+    """
+    path = normalize_path(path)
+    try:
+        frames = tifffile.memmap(path, mode="r")
+    except ValueError:
+        frames = tifffile.imread(path)
+
+    with tifffile.TiffFile(path) as tif:
+        metadata = tif.shaped_metadata[0] if tif.shaped_metadata else {}
+        frame_shape, n_frames = _tiff_frame_shape(tif)
+    frames = frames.reshape((n_frames,) + tuple(frame_shape))
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    filenames = list(metadata.get("filenames", []))
+    if len(filenames) != len(frames):
+        filenames = [f"{stem}_{i + 1}.tiff" for i in range(len(frames))]
+
+    return frames, filenames
+
+
+def stack_base_dir(path: str) -> str:
+    """
+    Directory that outputs for a frames input are written to.
+    For a stack 'folder.stack' this is 'folder', so results land where they would for the unpacked folder,
+    the same for a multi-page TIFF 'channel_0.tiff'.
+    """
+    path = normalize_path(path)
+    if is_stack(path) or is_multipage_tiff(path):
+        return os.path.splitext(path)[0]
+    return path
+
+
+def _read_header(f) -> tuple[dict, int]:
+    magic = f.read(len(STACK_MAGIC))
+    if magic != STACK_MAGIC:
+        raise ValueError(f"{f.name} is not a frame stack")
+    header_length = int.from_bytes(f.read(8), "little")
+    header = json.loads(f.read(header_length).decode())
+    return header, header["data_offset"]
+
+
+def _header_bytes(header: dict) -> bytes:
+    prefix_length = len(STACK_MAGIC) + 8
+
+    # data_offset depends on the header length, so iterate until it is stable
+    header["data_offset"] = 0
+    while True:
+        encoded = json.dumps(header).encode()
+        data_offset = (
+            -(-(prefix_length + len(encoded)) // HEADER_ALIGNMENT) * HEADER_ALIGNMENT
+        )
+        if data_offset == header["data_offset"]:
+            break
+        header["data_offset"] = data_offset
+
+    encoded = encoded.ljust(data_offset - prefix_length, b" ")
+    return STACK_MAGIC + len(encoded).to_bytes(8, "little") + encoded
+
+
+def open_stack(path: str, mode: str = "r") -> FrameStack:
+    """
+    Open a frame stack memory-mapped.
+    - mode: np.memmap mode, "r" (read-only), "r+" (read/write) or "c" (copy-on-write)
+    """
+    path = normalize_path(path)
+    with open(path, "rb") as f:
+        header, data_offset = _read_header(f)
+
+    frames = np.memmap(
+        path,
+        dtype=np.dtype(header["dtype"]),
+        mode=mode,
+        offset=data_offset,
+        shape=tuple(header["shape"]),
+    )
+
+    return FrameStack(path, frames, header["filenames"], header["metadata"])
+
+
+def create_stack(
+    path: str,
+    shape: tuple[int, ...],
+    filenames: list[str],
+    dtype: np.dtype = np.uint16,
+    metadata: dict = None,
+) -> FrameStack:
+    """Create an empty frame stack of the given (N, H, W[, C]) shape, opened for writing."""
+    path = normalize_path(path)
+    header = {
+        "dtype": np.dtype(dtype).str,
+        "shape": list(shape),
+        "filenames": filenames,
+        "metadata": metadata or {},
+    }
+    header_bytes = _header_bytes(header)
+
+    data_size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    with open(path, "wb") as f:
+        f.write(header_bytes)
+        f.truncate(len(header_bytes) + data_size)
+
+    return open_stack(path, mode="r+")
+
+
+def pack_folder(
+    folder: str,
+    output_path: str = None,
+    file_format: str = None,
+    bit_depth: int = 16,
+    n_workers: int = None,
+) -> FrameStack:
+    """
+    Pack all images of a folder into a single frame stack.
+    - output_path: path of the stack, defaults to '<folder>.stack' next to the folder
+    - file_format: if file_format is set, only images with that format will be packed
+    - bit_depth: 8 or 16
+    """
+    folder = normalize_path(folder).rstrip("/")
+    output_path = folder + STACK_EXTENSION if output_path is None else output_path
+
+    filenames = list_image_files(folder, file_format)
+    if len(filenames) == 0:
+        raise ValueError(f"No images of format {file_format} found in {folder}!")
+
+    metadata = {
+        "source_folder": os.path.abspath(folder),
+        "file_format": file_format,
+        "bit_depth": bit_depth,
+        "source_files": [
+            {
+                "size": os.stat(os.path.join(folder, filename)).st_size,
+                "mtime_ns": os.stat(os.path.join(folder, filename)).st_mtime_ns,
+            }
+            for filename in filenames
+        ],
+    }
+
+    stack = None
+    frames = iter_images_from_folder(folder, file_format, bit_depth, n_workers)
+    for i, (_, image) in enumerate(frames):
+        if stack is None:
+            dtype = np.uint16 if bit_depth == 16 else image.dtype
+            stack = create_stack(
+                output_path, (len(filenames),) + image.shape, filenames, dtype, metadata
+            )
+        if image.shape != stack.frames.shape[1:]:
+            raise ValueError(
+                f"{filenames[i]} has shape {image.shape}, expected {stack.frames.shape[1:]}"
+            )
+        stack.frames[i] = image
+
+    stack.frames.flush()
+    print(f"Packed {len(filenames)} images from {folder} into {output_path}")
+
+    return open_stack(output_path)
+
+
+def load_frames(
+    input_path: str, file_format: str = None, bit_depth: int = 8, n_workers: int = 1
+) -> tuple[np.ndarray | list, list]:
+    """
+    Load frames from a frame stack or multi-page TIFF (memory-mapped, no copy) or from an image folder.
+    - input_path: path to a '.stack' file, a multi-page TIFF or a folder of images
+    """
+    if is_stack(input_path):
+        stack = open_stack(input_path)
+        return stack.frames, stack.filenames
+    if is_multipage_tiff(input_path):
+        return open_multipage_tiff(input_path)
+
+    return load_images_from_folder(input_path, file_format, bit_depth, n_workers)
+
+
+def iter_frames(
+    input_path: str, file_format: str = None, bit_depth: int = 8, n_workers: int = None
+) -> Iterator[tuple[str, np.ndarray]]:
+    """Yield (filename, frame) from a frame stack, a multi-page TIFF or an image folder."""
+    if is_stack(input_path):
+        stack = open_stack(input_path)
+        yield from zip(stack.filenames, stack.frames)
+    elif is_multipage_tiff(input_path):
+        frames, filenames = open_multipage_tiff(input_path)
+        yield from zip(filenames, frames)
+    else:
+        yield from iter_images_from_folder(
+            input_path, file_format, bit_depth, n_workers
+        )
+
+
+def spool_frames(frames: Iterable[np.ndarray], path: str) -> np.memmap:
+    """
+    Write frames one at a time to a raw file and return them memory-mapped as one (N, H, W[, C]) array.
+    Only one frame is held in memory, so iterators of any length can be turned into an array.
+    """
+    shape, dtype, n_frames = None, None, 0
+    with open(path, "wb") as f:
+        for frame in frames:
+            frame = np.asarray(frame)
+            if shape is None:
+                shape, dtype = frame.shape, frame.dtype
+            elif frame.shape != shape:
+                raise ValueError(
+                    f"Frame {n_frames} has shape {frame.shape}, expected {shape}"
+                )
+            f.write(np.ascontiguousarray(frame, dtype=dtype).tobytes())
+            n_frames += 1
+
+    if n_frames == 0:
+        raise ValueError("No frames to spool")
+
+    return np.memmap(path, dtype=dtype, mode="r", shape=(n_frames,) + shape)
+
+
+def shifts_cache_path(input_path: str) -> str:
+    """CSV file the registration shifts of a dataset are cached in."""
+    return os.path.join(stack_base_dir(input_path), SHIFTS_FILENAME)
+
+
+@contextlib.contextmanager
+def open_frames(
+    input_path: str,
+    file_format: str = None,
+    bit_depth: int = 8,
+    n_workers: int = None,
+    align: bool = False,
+) -> Iterator[tuple[np.ndarray, list]]:
+    """
+    Context manager giving (frames, filenames) with frames as one memory-mapped (N, H, W[, C]) array.
+    Stacks and multi-page TIFFs are mapped directly, image folders are decoded once into a
+    temporary file that is removed on exit.
+    - align: register the frames to the first one (see helpers.registration.align_frames),
+      the aligned frames are written to a temporary file as well
+    """
+    if is_stack(input_path) and not align:
+        stack = open_stack(input_path)
+        yield stack.frames, stack.filenames
+        return
+    if is_multipage_tiff(input_path) and not align:
+        yield open_multipage_tiff(input_path)
+        return
+
+    frames = iter_frames(input_path, file_format, bit_depth, n_workers)
+    if align:
+        frames = align_frames(
+            frames, cache_path=shifts_cache_path(input_path), n_workers=n_workers
+        )
+
+    filenames = []
+
+    def images():
+        for filename, image in frames:
+            filenames.append(filename)
+            yield image
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        frames = spool_frames(images(), os.path.join(tmp_dir, "frames.raw"))
+        try:
+            yield frames, filenames
+        finally:
+            del frames
+
+
+def count_frames(input_path: str, file_format: str = None) -> int:
+    if is_stack(input_path):
+        return len(open_stack(input_path))
+    if is_multipage_tiff(input_path):
+        with tifffile.TiffFile(normalize_path(input_path)) as tif:
+            return _tiff_frame_shape(tif)[1]
+    return len(list_image_files(input_path, file_format))
+
+
+@click.command()
+@input_dir_option
+@is_raw_option
+@n_workers_option
+def cli_pack_folder(input_dir: str, is_raw: bool, n_workers: int):
+    pack_folder(
+        input_dir,
+        file_format="dng" if is_raw else "tiff",
+        bit_depth=16,
+        n_workers=n_workers,
+    )
+
+
+if __name__ == "__main__":
+    cli_pack_folder()
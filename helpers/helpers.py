@@ -4,61 +4,250 @@ import numpy as np
 import re
 import csv
 import rawpy
+import tifffile
 from PIL import Image
+from typing import Iterator
 
 import matplotlib.pyplot as plt
 
 from tqdm import tqdm
 
+from helpers.parallel import bounded_imap
+from helpers.frame_cache import get_frame_cache
+from helpers.instrumentation import instrumented
+
+
+def _postprocess_params(bit_depth: int) -> dict:
+    """rawpy postprocess parameters used for the given bit depth."""
+    if bit_depth == 16:
+        return {
+            "no_auto_bright": False,
+            "use_auto_wb": False,
+            "use_camera_wb": False,
+            "gamma": (1, 1),
+            "output_bps": 16,
+        }
+    else:
+        return {}
+
 
-def load_image(file_path: str, bit_depth: int = 8) -> np.ndarray:
+def center_window(
+    shape: tuple[int, ...], crop_factor: int
+) -> tuple[int, int, int, int]:
+    """
+    Window (x, y, width, height) of the central square covering 1 / crop_factor of the shorter image side.
+    """
+    square_size = int(min(shape[0], shape[1]) / crop_factor)
+    start_x = shape[1] // 2 - square_size // 2
+    start_y = shape[0] // 2 - square_size // 2
+    return start_x, start_y, square_size, square_size
+
+
+def _resolve_window(
+    shape: tuple[int, ...],
+    window: tuple[int, int, int, int] = None,
+    crop_factor: int = None,
+) -> tuple[int, int, int, int] | None:
+    if window is not None and crop_factor is not None:
+        raise ValueError("Pass either window or crop_factor, not both")
+    if crop_factor is not None:
+        return center_window(shape, crop_factor)
+    return window
+
+
+def _apply_window(
+    image: np.ndarray, window: tuple[int, int, int, int] | None
+) -> np.ndarray:
+    if window is None:
+        return image
+    x, y, width, height = window
+    # copy, so that the full frame can be released
+    return np.ascontiguousarray(image[y : y + height, x : x + width])
+
+
+def bayer_planes(
+    raw: rawpy.RawPy, window: tuple[int, int, int, int] = None
+) -> np.ndarray:
+    """
+    Split the visible raw Bayer mosaic into half-resolution R, G1, G2, B planes
+    with the black level subtracted. No demosaicing, colour conversion or gamma is applied.
+    - window: (x, y, width, height) in plane coordinates, only this part of the mosaic is converted
+
+    Returns:
+    np.ndarray: uint16 array of shape (H / 2, W / 2, 4) with the planes in R, G1, G2, B order.
+    """
+    raw_image = raw.raw_image_visible
+    raw_colors = raw.raw_colors_visible
+    color_desc = raw.color_desc.decode()
+    black_levels = raw.black_level_per_channel
+
+    if sorted(color_desc) != ["B", "G", "G", "R"]:
+        raise ValueError(f"Unsupported color filter array {color_desc}")
+
+    if window is not None:
+        # even offsets keep the colour filter pattern aligned
+        x, y, width, height = window
+        raw_window = (
+            slice(2 * y, 2 * (y + height)),
+            slice(2 * x, 2 * (x + width)),
+        )
+        raw_image = raw_image[raw_window]
+        raw_colors = raw_colors[raw_window]
+
+    height = (raw_image.shape[0] // 2) * 2
+    width = (raw_image.shape[1] // 2) * 2
+
+    planes = {"R": [], "G": [], "B": []}
+    for dy in range(2):
+        for dx in range(2):
+            color = raw_colors[dy, dx]
+            plane = raw_image[dy:height:2, dx:width:2].astype(np.int32)
+            plane -= black_levels[color]
+            planes[color_desc[color]].append(plane)
+
+    if len(planes["R"]) != 1 or len(planes["G"]) != 2 or len(planes["B"]) != 1:
+        raise ValueError(f"Unsupported Bayer pattern {raw_colors[:2, :2].tolist()}")
+
+    planes = planes["R"] + planes["G"] + planes["B"]
+
+    return np.clip(np.dstack(planes), 0, np.iinfo(np.uint16).max).astype(np.uint16)
+
+
+def _load_tiff_window(
+    file_path: str,
+    bit_depth: int,
+    window: tuple[int, int, int, int] = None,
+    crop_factor: int = None,
+) -> np.ndarray | None:
+    """
+    Read only the window of an uncompressed TIFF via a memory map.
+    Returns None if the file cannot be read this way (compressed, non-native byte order or a mode
+    that load_image converts), in which case the image has to be decoded completely.
+    """
+    try:
+        with tifffile.TiffFile(file_path) as tif:
+            page = tif.pages[0]
+            if not page.is_memmappable or not page.dtype.isnative:
+                return None
+            if bit_depth == 16 and not (page.dtype == np.uint16 and page.ndim == 2):
+                return None
+            shape = page.shape
+    except tifffile.TiffFileError:
+        return None
+
+    window = _resolve_window(shape, window, crop_factor)
+    image = tifffile.memmap(file_path, page=0, mode="r")
+    return _apply_window(image, window)
+
+
+@instrumented(path_arg="file_path")
+def load_image(
+    file_path: str,
+    bit_depth: int = 8,
+    use_cache: bool = True,
+    bayer: bool = False,
+    window: tuple[int, int, int, int] = None,
+    crop_factor: int = None,
+) -> np.ndarray:
     """
     Load a single image file with the specified bit depth.
     - bit_depth: 8 or 16
+    - use_cache: look up / store decoded DNGs in the frame cache (enabled via IMAGE_PROCESSING_CACHE_DIR)
+    - bayer: DNG only, skip demosaicing and return the linear R, G1, G2, B planes at half resolution (see bayer_planes)
+    - window: (x, y, width, height), only this region is returned
+    - crop_factor: return only the central square covering 1 / crop_factor of the shorter side (see center_window)
+
+    Uncompressed TIFFs and cached DNGs are read through a memory map, so only the window is read from disk.
+    Bayer planes are only extracted for the window. Demosaiced DNGs are processed completely by LibRaw
+    and cropped afterwards.
     """
     file_path = normalize_path(file_path)
     file_format = "." + (file_path.split(".")[-1]).lower()
 
+    if bayer and file_format != ".dng":
+        raise ValueError(f"Bayer planes can only be loaded from DNGs, got {file_path}")
+
     if file_format == ".dng":
+        postprocess_params = _postprocess_params(bit_depth)
+        cache_params = (
+            {"bayer": True}
+            if bayer
+            else {"bit_depth": bit_depth, "postprocess": postprocess_params}
+        )
+
+        cache = get_frame_cache() if use_cache else None
+        if cache is not None:
+            cache_key = cache.key(file_path, cache_params)
+            image = cache.get(cache_key)
+            if image is not None:
+                return _apply_window(
+                    image, _resolve_window(image.shape, window, crop_factor)
+                )
+
         try:
             with rawpy.imread(file_path) as raw:
-                if bit_depth == 16:
-                    return raw.postprocess(
-                        no_auto_bright=False,
-                        use_auto_wb=False,
-                        use_camera_wb=False,
-                        gamma=(1, 1),
-                        output_bps=16,
-                    ).astype(np.uint16)
+                if bayer and cache is None:
+                    shape = (raw.sizes.height // 2, raw.sizes.width // 2)
+                    return bayer_planes(
+                        raw, _resolve_window(shape, window, crop_factor)
+                    )
+                elif bayer:
+                    image = bayer_planes(raw)
                 else:
-                    return raw.postprocess()
+                    image = raw.postprocess(**postprocess_params)
+                    if bit_depth == 16:
+                        image = image.astype(np.uint16)
         except Exception as e:
             raise Exception(f"Error loading {file_path}: {e}")
 
+        if cache is not None:
+            cache.put(cache_key, image)
+
+        return _apply_window(image, _resolve_window(image.shape, window, crop_factor))
+
     else:
+        if file_format in (".tif", ".tiff") and (
+            window is not None or crop_factor is not None
+        ):
+            image = _load_tiff_window(file_path, bit_depth, window, crop_factor)
+            if image is not None:
+                return image
+
         try:
             image = Image.open(file_path)
 
             if bit_depth == 16 and image.mode not in ("I", "I;16"):
                 image = image.convert("I")
-                return np.array(image, dtype=np.uint16)
+                image = np.array(image, dtype=np.uint16)
             else:
-                return np.array(image)
+                image = np.array(image)
         except Exception as e:
             raise Exception(f"Error loading {file_path}: {e}")
 
+        return _apply_window(image, _resolve_window(image.shape, window, crop_factor))
 
-def load_images_from_folder(
-    folder: str, file_format: str = None, bit_depth: int = 8
-) -> tuple[list, list]:
+
+@instrumented("save_tiff", path_arg="file_path", writes=True)
+def save_tiff_16bit(image: np.ndarray, file_path: str) -> None:
+    """Save a single-channel image as 16-bit TIFF."""
+    im = Image.fromarray(image.astype(np.uint16), mode="I;16")
+    im.save(file_path, format="TIFF")
+
+
+def natural_sort_key(filename: str) -> list:
+    """Sort key ordering numbers in file names by value, e.g. cropped_2.tiff before cropped_10.tiff."""
+    return [
+        int(part) if part.isdigit() else part.lower()
+        for part in re.split(r"(\d+)", filename)
+    ]
+
+
+def list_image_files(folder: str, file_format: str = None) -> list[str]:
     """
-    Load images from a folder with specified format and bit depth.
-    - file_format: if file_format is set, only images with that format will be loaded
-    - bit_depth: 8 or 16
+    List the supported image files in a folder in natural sort order (see natural_sort_key).
+    - file_format: if file_format is set, only files with that format will be listed
     """
     folder = normalize_path(folder)
-    images = []
-    filenames = []
 
     if file_format and not file_format.startswith("."):
         file_format = "." + file_format.lower()
@@ -66,7 +255,8 @@ def load_images_from_folder(
     supported_formats = set(Image.registered_extensions().keys())
     supported_formats.add(".dng")
 
-    for filename in tqdm(os.listdir(folder), desc="Loading images"):
+    filenames = []
+    for filename in sorted(os.listdir(folder), key=natural_sort_key):
         current_format = "." + (filename.split(".")[-1]).lower()
 
         if (
@@ -76,9 +266,84 @@ def load_images_from_folder(
         ):
             continue
 
-        file_path = os.path.join(folder, filename)
-        image = load_image(file_path, bit_depth)
+        filenames.append(filename)
+
+    return filenames
+
+
+def _load_image_task(task: tuple[str, dict]) -> np.ndarray:
+    file_path, kwargs = task
+    return load_image(file_path, **kwargs)
+
+
+def iter_images_from_folder(
+    folder: str,
+    file_format: str = None,
+    bit_depth: int = 8,
+    n_workers: int = None,
+    prefetch: int = None,
+    bayer: bool = False,
+    window: tuple[int, int, int, int] = None,
+    crop_factor: int = None,
+) -> Iterator[tuple[str, np.ndarray]]:
+    """
+    Decode images from a folder on a process pool and yield (filename, image) in sorted filename order.
+    At most prefetch decoded images are held in memory at any time.
+    - file_format: if file_format is set, only images with that format will be loaded
+    - bit_depth: 8 or 16
+    - n_workers: number of decoding processes, defaults to the number of CPUs
+    - prefetch: maximum number of images decoded ahead of the consumer (default 2 * n_workers)
+    - bayer: load DNGs as R, G1, G2, B planes without demosaicing (see load_image)
+    - window, crop_factor: only decode / keep this region of every image (see load_image)
+    """
+    folder = normalize_path(folder)
+    filenames = list_image_files(folder, file_format)
+
+    kwargs = {
+        "bit_depth": bit_depth,
+        "bayer": bayer,
+        "window": window,
+        "crop_factor": crop_factor,
+    }
+    tasks = [(os.path.join(folder, filename), kwargs) for filename in filenames]
+    images = bounded_imap(_load_image_task, tasks, n_workers, prefetch)
+
+    for filename, image in tqdm(
+        zip(filenames, images), desc="Loading images", total=len(filenames)
+    ):
+        yield filename, image
+
+
+def load_images_from_folder(
+    folder: str,
+    file_format: str = None,
+    bit_depth: int = 8,
+    n_workers: int = 1,
+    bayer: bool = False,
+    window: tuple[int, int, int, int] = None,
+    crop_factor: int = None,
+) -> tuple[list, list]:
+    """
+    Load images from a folder with specified format and bit depth.
+    - file_format: if file_format is set, only images with that format will be loaded
+    - bit_depth: 8 or 16
+    - n_workers: number of decoding processes, None uses all CPUs
+    - bayer: load DNGs as R, G1, G2, B planes without demosaicing (see load_image)
+    - window, crop_factor: only decode / keep this region of every image (see load_image)
+    """
+    folder = normalize_path(folder)
+    images = []
+    filenames = []
 
+    for filename, image in iter_images_from_folder(
+        folder,
+        file_format,
+        bit_depth,
+        n_workers,
+        bayer=bayer,
+        window=window,
+        crop_factor=crop_factor,
+    ):
         images.append(image)
         filenames.append(filename)
 
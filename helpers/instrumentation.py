@@ -0,0 +1,250 @@
+import os
+import json
+import glob
+import time
+import inspect
+import functools
+import threading
+from contextlib import contextmanager
+from typing import Callable
+
+import pandas as pd
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+PROFILE_DIR_ENV = "IMAGE_PROCESSING_PROFILE_DIR"
+
+RECORDS_CSV = "records.csv"
+SUMMARY_JSON = "summary.json"
+
+# interval of the RSS sampler, allocations shorter than this may be missed
+RSS_SAMPLE_INTERVAL_S = 0.005
+
+
+def profile_dir() -> str | None:
+    """
+    Directory the records are written to, or None if instrumentation is disabled.
+    - IMAGE_PROCESSING_PROFILE_DIR: instrumentation is enabled if set. Worker processes inherit
+      the variable, so calls in process pools are recorded as well.
+    """
+    return os.environ.get(PROFILE_DIR_ENV) or None
+
+
+def enable_profiling(directory: str) -> None:
+    """Enable instrumentation for this process and its workers, removing records of earlier runs."""
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "records_*.jsonl")):
+        os.remove(path)
+    os.environ[PROFILE_DIR_ENV] = directory
+
+
+def disable_profiling() -> None:
+    os.environ.pop(PROFILE_DIR_ENV, None)
+
+
+_process = None  # psutil.Process of this process, created again after a fork
+
+
+def _current_rss() -> int | None:
+    """Resident set size of this process in bytes, None if it cannot be read."""
+    global _process
+    if psutil is not None:
+        if _process is None or _process.pid != os.getpid():
+            _process = psutil.Process()
+        return _process.memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):  # no procfs (macOS, Windows)
+        return None
+
+
+class _RSSSampler:
+    """
+    Background thread sampling the current RSS while blocks are measured, so every block gets
+    the peak reached during that block (not the lifetime peak of the process). Blocks running
+    concurrently in threads of one process share the process RSS, so their peaks include each other.
+    The thread exits when no block is measured and is started again with the next one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._peaks = {}
+        self._thread = None
+
+    def _run(self):
+        while True:
+            time.sleep(RSS_SAMPLE_INTERVAL_S)
+            rss = _current_rss()
+            with self._lock:
+                if not self._peaks:
+                    self._thread = None
+                    return
+                for token, peak in self._peaks.items():
+                    self._peaks[token] = max(peak, rss)
+
+    def start(self, token: object, rss: int) -> None:
+        with self._lock:
+            self._peaks[token] = rss
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def stop(self, token: object, rss: int) -> int:
+        with self._lock:
+            return max(self._peaks.pop(token), rss)
+
+
+_rss_sampler = _RSSSampler()
+
+
+def _write_record(directory: str, record: dict) -> None:
+    # one file per process, lines are appended as calls finish
+    path = os.path.join(directory, f"records_{os.getpid()}.jsonl")
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+@contextmanager
+def measure(stage: str, frame: str = None):
+    """
+    Record wall time, CPU time and memory of a block of code, if instrumentation is enabled.
+    Yields the record, so bytes_read / bytes_written can be added inside the block.
+    CPU time is that of the calling thread: work delegated to worker processes shows up in the
+    records of the instrumented functions they call.
+    Memory is the RSS of the process at the start of the block (rss_start_mb), the peak RSS
+    sampled during the block (peak_rss_mb) and the difference (rss_growth_mb). It is None where
+    the RSS cannot be read (without psutil on systems without /proc).
+    """
+    directory = profile_dir()
+    record = {"stage": stage, "frame": frame, "bytes_read": 0, "bytes_written": 0}
+    if directory is None:
+        yield record
+        return
+
+    rss_start = _current_rss()
+    token = object()
+    if rss_start is not None:
+        _rss_sampler.start(token, rss_start)
+
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield record
+    finally:
+        record["wall_s"] = time.perf_counter() - wall_start
+        record["cpu_s"] = time.thread_time() - cpu_start
+        record["rss_start_mb"] = record["peak_rss_mb"] = record["rss_growth_mb"] = None
+        if rss_start is not None:
+            peak = _rss_sampler.stop(token, _current_rss())
+            record["rss_start_mb"] = rss_start / 2**20
+            record["peak_rss_mb"] = peak / 2**20
+            record["rss_growth_mb"] = (peak - rss_start) / 2**20
+        record["pid"] = os.getpid()
+        record["end"] = time.time()
+        _write_record(directory, record)
+
+
+def instrumented(stage: str = None, path_arg: str = None, writes: bool = False):
+    """
+    Decorator recording every call of a function with measure.
+    - stage: name in the report, defaults to the function name
+    - path_arg: name of a file path argument, its file name labels the frame and the file size
+      is counted as bytes read, or with writes=True as bytes written after the call
+    """
+
+    def decorator(func: Callable) -> Callable:
+        name = stage or func.__name__
+        signature = inspect.signature(func) if path_arg else None
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if profile_dir() is None:
+                return func(*args, **kwargs)
+
+            path = None
+            if signature is not None:
+                path = signature.bind(*args, **kwargs).arguments.get(path_arg)
+
+            frame = os.path.basename(path) if path else None
+            with measure(name, frame) as record:
+                if path and not writes and os.path.isfile(path):
+                    record["bytes_read"] = os.path.getsize(path)
+                result = func(*args, **kwargs)
+                if path and writes and os.path.isfile(path):
+                    record["bytes_written"] = os.path.getsize(path)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def load_records(directory: str) -> pd.DataFrame:
+    """All records of all processes, in the order the calls finished."""
+    records = []
+    for path in glob.glob(os.path.join(directory, "records_*.jsonl")):
+        with open(path) as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+
+    df = pd.DataFrame(
+        records,
+        columns=[
+            "stage",
+            "frame",
+            "pid",
+            "end",
+            "wall_s",
+            "cpu_s",
+            "bytes_read",
+            "bytes_written",
+            "rss_start_mb",
+            "peak_rss_mb",
+            "rss_growth_mb",
+        ],
+    )
+    return df.sort_values("end", ignore_index=True)
+
+
+def summarize(records: pd.DataFrame) -> pd.DataFrame:
+    """
+    Totals per stage. cpu_per_wall well below 1 means a stage mostly waits (I/O or workers),
+    MB_per_s gives the throughput of reading / writing stages, rss_growth_mb the most memory
+    a single call added on top of what was in use when it started. Pipeline stages
+    ("stage ...") contain the calls of the instrumented functions, so their times overlap.
+    """
+    grouped = records.groupby("stage", sort=False)
+    summary = pd.DataFrame(
+        {
+            "calls": grouped.size(),
+            "wall_s": grouped["wall_s"].sum(),
+            "wall_s_mean": grouped["wall_s"].mean(),
+            "cpu_s": grouped["cpu_s"].sum(),
+            "bytes_read": grouped["bytes_read"].sum(),
+            "bytes_written": grouped["bytes_written"].sum(),
+            "peak_rss_mb": grouped["peak_rss_mb"].max(),
+            "rss_growth_mb": grouped["rss_growth_mb"].max(),
+        }
+    )
+    summary["cpu_per_wall"] = summary["cpu_s"] / summary["wall_s"]
+    summary["MB_per_s"] = (
+        (summary["bytes_read"] + summary["bytes_written"]) / 2**20 / summary["wall_s"]
+    )
+    return summary.sort_values("wall_s", ascending=False)
+
+
+def write_report(directory: str) -> pd.DataFrame:
+    """
+    Save all records to records.csv and the per-stage summary to summary.json in directory.
+    Returns the summary.
+    """
+    records = load_records(directory)
+    records.to_csv(os.path.join(directory, RECORDS_CSV), index=False)
+
+    summary = summarize(records)
+    summary.to_json(os.path.join(directory, SUMMARY_JSON), orient="index", indent=2)
+
+    return summary
@@ -0,0 +1,127 @@
+import os
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from typing import Callable, Iterable, Iterator
+
+
+def default_n_workers() -> int:
+    return os.cpu_count() or 1
+
+
+def bounded_imap(
+    func: Callable,
+    items: Iterable,
+    n_workers: int = None,
+    prefetch: int = None,
+    use_threads: bool = False,
+    executor: Executor = None,
+) -> Iterator:
+    """
+    Map func over items on a worker pool and yield the results in input order.
+    - n_workers: number of workers, 1 runs everything in the calling process
+    - prefetch: maximum number of submitted but not yet yielded items (default 2 * n_workers)
+    - use_threads: use a thread pool instead of a process pool (for functions that release the GIL)
+    - executor: submit to this pool instead of creating one, e.g. one process pool shared by
+      concurrent callers; n_workers then only sets the default prefetch
+    """
+    n_workers = default_n_workers() if n_workers is None else max(1, n_workers)
+    prefetch = 2 * n_workers if prefetch is None else max(1, prefetch)
+
+    if executor is not None:
+        yield from _imap(executor, func, items, prefetch)
+        return
+
+    if n_workers == 1:
+        for item in items:
+            yield func(item)
+        return
+
+    executor_class = ThreadPoolExecutor if use_threads else ProcessPoolExecutor
+    with executor_class(max_workers=n_workers) as executor:
+        yield from _imap(executor, func, items, prefetch)
+
+
+def _imap(
+    executor: Executor, func: Callable, items: Iterable, prefetch: int
+) -> Iterator:
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= prefetch:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def run_task_graph(
+    tasks: dict[str, tuple[Callable, list[str]]], n_workers: int = None
+) -> dict:
+    """
+    Run a graph of dependent tasks on a thread pool, every task as soon as its dependencies are done.
+    Results are passed between tasks in memory, so tasks should release the GIL for most of their
+    work (numpy, OpenCV, scikit-image).
+    - tasks: {name: (func, names of the tasks it depends on)}, func is called with the results of
+      its dependencies as positional arguments in that order
+    - n_workers: number of threads, 1 runs the tasks one after another in the calling thread
+
+    Returns:
+    {name: result}, results are kept until the whole graph is done
+    """
+    for name, (_, dependencies) in tasks.items():
+        for dependency in dependencies:
+            if dependency not in tasks:
+                raise ValueError(f"Task {name} depends on unknown task {dependency}")
+
+    n_workers = default_n_workers() if n_workers is None else max(1, n_workers)
+    results = {}
+    remaining = dict(tasks)
+
+    def ready() -> list[str]:
+        return [
+            name
+            for name, (_, dependencies) in remaining.items()
+            if all(dependency in results for dependency in dependencies)
+        ]
+
+    def arguments(name: str) -> list:
+        return [results[dependency] for dependency in tasks[name][1]]
+
+    if n_workers == 1:
+        while remaining:
+            names = ready()
+            if not names:
+                raise ValueError(f"Task graph has a cycle in {list(remaining)}")
+            for name in names:
+                func, _ = remaining.pop(name)
+                results[name] = func(*arguments(name))
+        return results
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        running = {}
+        try:
+            while remaining or running:
+                for name in ready():
+                    func, _ = remaining.pop(name)
+                    running[executor.submit(func, *arguments(name))] = name
+                if not running:
+                    raise ValueError(f"Task graph has a cycle in {list(remaining)}")
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+        finally:
+            for future in running:
+                future.cancel()
+
+    return results
@@ -0,0 +1,190 @@
+import os
+from functools import partial
+from typing import Iterable, Iterator
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from helpers.parallel import bounded_imap
+
+SHIFTS_FILENAME = "registration_shifts.csv"
+DEFAULT_LEVELS = 3
+DEFAULT_REFINE_SIZE = 512
+
+
+def _gray_float(image: np.ndarray) -> np.ndarray:
+    # mean over the channels, works for RGB as well as Bayer planes
+    image = np.asarray(image, dtype=np.float32)
+    if image.ndim == 3:
+        image = image.mean(axis=2)
+    return image
+
+
+def _downsample(image: np.ndarray, levels: int) -> np.ndarray:
+    for _ in range(levels):
+        image = cv2.pyrDown(image)
+    return image
+
+
+def _center_window(shape: tuple[int, int], size: int) -> tuple[int, int, int, int]:
+    h = min(size, shape[0])
+    w = min(size, shape[1])
+    return (shape[1] - w) // 2, (shape[0] - h) // 2, w, h
+
+
+class Reference:
+    """
+    Reference frame for registration, with the pyramid level and full resolution window
+    used by estimate_shift precomputed once.
+    - levels: number of pyrDown steps for the coarse estimate (downsampling by 2**levels)
+    - refine_size: size of the central full resolution window used for the sub-pixel refinement
+    """
+
+    def __init__(
+        self,
+        image: np.ndarray,
+        levels: int = DEFAULT_LEVELS,
+        refine_size: int = DEFAULT_REFINE_SIZE,
+    ):
+        gray = _gray_float(image)
+        self.shape = gray.shape
+        self.levels = levels
+
+        self.coarse = _downsample(gray, levels)
+        self.coarse_window = cv2.createHanningWindow(
+            self.coarse.shape[::-1], cv2.CV_32F
+        )
+
+        self.window = _center_window(self.shape, refine_size)
+        x, y, w, h = self.window
+        self.fine = np.ascontiguousarray(gray[y : y + h, x : x + w])
+        self.fine_window = cv2.createHanningWindow((w, h), cv2.CV_32F)
+
+
+def estimate_shift(reference: Reference, image: np.ndarray) -> tuple[float, float]:
+    """
+    Estimate the translation (dx, dy) of image relative to the reference by phase correlation,
+    coarse on a downsampled pyramid level and refined to sub-pixel accuracy on a central
+    full resolution window.
+    """
+    gray = _gray_float(image)
+    if gray.shape != reference.shape:
+        raise ValueError(f"Frame has shape {gray.shape}, expected {reference.shape}")
+
+    # COARSE ESTIMATE
+    coarse = _downsample(gray, reference.levels)
+    (dx, dy), _ = cv2.phaseCorrelate(reference.coarse, coarse, reference.coarse_window)
+    dx, dy = dx * 2**reference.levels, dy * 2**reference.levels
+
+    # REFINEMENT on the window shifted by the coarse estimate
+    x, y, w, h = reference.window
+    x_shift = int(np.clip(round(dx), -x, reference.shape[1] - w - x))
+    y_shift = int(np.clip(round(dy), -y, reference.shape[0] - h - y))
+    fine = np.ascontiguousarray(
+        gray[y + y_shift : y + y_shift + h, x + x_shift : x + x_shift + w]
+    )
+    (residual_x, residual_y), _ = cv2.phaseCorrelate(
+        reference.fine, fine, reference.fine_window
+    )
+
+    return x_shift + residual_x, y_shift + residual_y
+
+
+def warp_frame(image: np.ndarray, shift: tuple[float, float]) -> np.ndarray:
+    """Translate the frame by -shift (bilinear, reflected borders), keeping its dtype."""
+    dx, dy = shift
+    if dx == 0 and dy == 0:
+        return image
+
+    matrix = np.float32([[1, 0, -dx], [0, 1, -dy]])
+    image = np.ascontiguousarray(image)
+    return cv2.warpAffine(
+        image,
+        matrix,
+        (image.shape[1], image.shape[0]),
+        flags=cv2.INTER_LINEAR,
+        borderMode=cv2.BORDER_REFLECT,
+    )
+
+
+def load_shifts(cache_path: str, reference: Reference, reference_filename: str) -> dict:
+    """Cached shifts {filename: (dx, dy)} estimated for the same reference and frame size, or {}."""
+    if cache_path is None or not os.path.exists(cache_path):
+        return {}
+
+    df = pd.read_csv(cache_path)
+    df = df[
+        (df["reference"] == reference_filename)
+        & (df["levels"] == reference.levels)
+        & (df["height"] == reference.shape[0])
+        & (df["width"] == reference.shape[1])
+    ]
+    return {row.filename: (row.dx, row.dy) for row in df.itertuples()}
+
+
+def save_shifts(
+    cache_path: str, shifts: dict, reference: Reference, reference_filename: str
+) -> None:
+    df = pd.DataFrame(
+        {
+            "filename": list(shifts.keys()),
+            "dx": [shift[0] for shift in shifts.values()],
+            "dy": [shift[1] for shift in shifts.values()],
+            "reference": reference_filename,
+            "levels": reference.levels,
+            "height": reference.shape[0],
+            "width": reference.shape[1],
+        }
+    )
+    df.to_csv(cache_path, index=False)
+
+
+def _register_task(reference: Reference, cached_shifts: dict, task: tuple) -> tuple:
+    filename, image = task
+    shift = cached_shifts.get(filename)
+    estimated = shift is None
+    if estimated:
+        shift = estimate_shift(reference, image)
+    return filename, shift, estimated, warp_frame(image, shift)
+
+
+def align_frames(
+    frames: Iterable[tuple[str, np.ndarray]],
+    cache_path: str = None,
+    levels: int = DEFAULT_LEVELS,
+    n_workers: int = None,
+) -> Iterator[tuple[str, np.ndarray]]:
+    """
+    Align (filename, frame) pairs to the first frame and yield them in input order.
+    Shifts are estimated with estimate_shift and frames are registered on a thread pool
+    (OpenCV releases the GIL).
+    - cache_path: CSV file with the estimated shifts of the dataset, e.g. in the dataset folder.
+      Shifts found there for the same reference frame are reused, new ones are added at the end.
+    """
+    frames = iter(frames)
+    try:
+        reference_filename, reference_image = next(frames)
+    except StopIteration:
+        return
+
+    reference = Reference(reference_image, levels)
+    cached_shifts = load_shifts(cache_path, reference, reference_filename)
+
+    shifts = {**cached_shifts, reference_filename: (0.0, 0.0)}
+    n_estimated = 0
+    yield reference_filename, reference_image
+
+    registered = bounded_imap(
+        partial(_register_task, reference, cached_shifts),
+        frames,
+        n_workers,
+        use_threads=True,
+    )
+    for filename, shift, estimated, image in registered:
+        shifts[filename] = shift
+        n_estimated += estimated
+        yield filename, image
+
+    if cache_path is not None and n_estimated > 0:
+        save_shifts(cache_path, shifts, reference, reference_filename)
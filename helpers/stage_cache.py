@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import hashlib
+from typing import Any, Callable
+
+from helpers.instrumentation import measure
+
+MANIFEST_PREFIX = ".stage_"
+
+# file modification times can be coarser than the clock, outputs are taken from this margin on
+MTIME_MARGIN_NS = 2 * 10**9
+
+
+def hash_key(*parts) -> str:
+    """Stable hash of JSON-serializable parts (stage names, parameters, upstream keys)."""
+    description = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha1(description.encode()).hexdigest()
+
+
+def fingerprint_files(folder: str, filenames: list[str]) -> list:
+    """(name, size, mtime) of input files, so that changed or replaced files change the key."""
+    fingerprint = []
+    for filename in filenames:
+        stat = os.stat(os.path.join(folder, filename))
+        fingerprint.append([filename, stat.st_size, stat.st_mtime_ns])
+    return fingerprint
+
+
+def _manifest_path(output_dir: str, stage: str) -> str:
+    return os.path.join(output_dir, f"{MANIFEST_PREFIX}{stage}.json")
+
+
+def load_manifest(output_dir: str, stage: str) -> dict | None:
+    try:
+        with open(_manifest_path(output_dir, stage)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _written_files(output_dir: str, since_ns: int) -> list:
+    # files below output_dir that were written by the stage
+    outputs = []
+    for root, _, files in os.walk(output_dir):
+        for filename in files:
+            if filename.startswith(MANIFEST_PREFIX):
+                continue
+            path = os.path.join(root, filename)
+            stat = os.stat(path)
+            if stat.st_mtime_ns >= since_ns:
+                outputs.append([os.path.relpath(path, output_dir), stat.st_size])
+    return sorted(outputs)
+
+
+def _outputs_intact(output_dir: str, manifest: dict) -> bool:
+    for relative_path, size in manifest["outputs"]:
+        path = os.path.join(output_dir, relative_path)
+        if not os.path.isfile(path) or os.path.getsize(path) != size:
+            return False
+    return True
+
+
+def run_stage(
+    stage: str,
+    output_dir: str,
+    inputs: list,
+    params: dict,
+    func: Callable[[], Any],
+    use_cache: bool = True,
+) -> tuple[str, Any]:
+    """
+    Run a pipeline stage unless its results are up to date.
+
+    The stage is keyed by a hash of its name, its inputs (keys of upstream stages or file
+    fingerprints) and its parameters. After a run a manifest with the key, the files the stage
+    wrote below output_dir and the JSON-serializable return value of func is saved in
+    output_dir. A later run with the same key whose output files are still present is skipped,
+    and since the key is passed on to downstream stages, changing one parameter only reruns the
+    stages that depend on it.
+
+    Returns:
+    (key of the stage, return value of func, from the manifest if the stage was skipped)
+    """
+    key = hash_key(stage, inputs, params)
+
+    manifest = load_manifest(output_dir, stage)
+    if (
+        use_cache
+        and manifest is not None
+        and manifest["key"] == key
+        and _outputs_intact(output_dir, manifest)
+    ):
+        print(f"Stage {stage} is up to date, skipping ({output_dir})")
+        return key, manifest.get("result")
+
+    start_ns = time.time_ns() - MTIME_MARGIN_NS
+    with measure(f"stage {stage}"):
+        result = func()
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {
+        "stage": stage,
+        "key": key,
+        "inputs": inputs,
+        "params": params,
+        "outputs": _written_files(output_dir, start_ns),
+        "result": result,
+    }
+    manifest_path = _manifest_path(output_dir, stage)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2, default=str)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    return key, result
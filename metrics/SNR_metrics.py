@@ -1,9 +1,143 @@
 import os
+from functools import lru_cache
+
 import numpy as np
 
 import matplotlib.pyplot as plt
 
+from metrics.moments import Moments, BLOCK_SIZE
+from helpers.instrumentation import instrumented
+
+# memory budget of the temporary copies in SNRMeasurement.evaluate_stack
+DEFAULT_CHUNK_BYTES = 64 * 2**20
+
+
+class SNRMeasurement:
+    """
+    Precomputed sampling regions of calc_SNR for one image shape, center, radius and offset,
+    to evaluate many frames with the same geometry.
 
+    The ROI square is stored as a bounding-box slice and the excluded disk around the LED as
+    a bounding-box slice with a mask, so evaluating a frame only touches the square and the
+    disk box; background statistics are the whole-frame statistics minus those of the disk.
+    Images may have a trailing channel dimension, whose values are pooled as in calc_SNR.
+    """
+
+    def __init__(
+        self,
+        shape: tuple[int, ...],
+        center: tuple[int, int],
+        radius: int,
+        offset_background: int = None,
+    ):
+        self.shape = tuple(shape)
+        height, width = self.shape[:2]
+
+        # ROI: square inscribed in the LED, pixels with |x - cx| <= s/2 and |y - cy| <= s/2
+        half_s = np.sqrt(2) * radius / 2
+        x0 = max(int(np.ceil(center[0] - half_s)), 0)
+        x1 = min(int(np.floor(center[0] + half_s)) + 1, width)
+        y0 = max(int(np.ceil(center[1] - half_s)), 0)
+        y1 = min(int(np.floor(center[1] + half_s)) + 1, height)
+        self.square = (slice(y0, max(y1, y0)), slice(x0, max(x1, x0)))
+
+        # background: everything outside the disk of radius + offset_background
+        offset_background = radius if offset_background is None else offset_background
+        bg_radius = radius + offset_background
+        x0 = min(max(int(np.ceil(center[0] - bg_radius)), 0), width)
+        x1 = min(max(int(np.floor(center[0] + bg_radius)) + 1, x0), width)
+        y0 = min(max(int(np.ceil(center[1] - bg_radius)), 0), height)
+        y1 = min(max(int(np.floor(center[1] + bg_radius)) + 1, y0), height)
+        self.disk = (slice(y0, y1), slice(x0, x1))
+        y, x = np.ogrid[y0:y1, x0:x1]
+        self.disk_mask = (x - center[0]) ** 2 + (y - center[1]) ** 2 <= bg_radius**2
+
+    def masks(self) -> tuple[np.ndarray, np.ndarray]:
+        """Full-frame boolean (square_mask, bg_mask), e.g. for plotting."""
+        square_mask = np.zeros(self.shape[:2], dtype=bool)
+        square_mask[self.square] = True
+        bg_mask = np.ones(self.shape[:2], dtype=bool)
+        bg_mask[self.disk] &= ~self.disk_mask
+        return square_mask, bg_mask
+
+    def evaluate(self, img: np.ndarray) -> tuple[float, float, float, float, float]:
+        """
+        SNR metrics of one image, see calc_SNR.
+
+        Returns:
+        (snr, signal, noise, mean_roi, mean_bg)
+        """
+        if img.shape != self.shape:
+            raise ValueError(f"Image has shape {img.shape}, expected {self.shape}")
+
+        return tuple(metric[0] for metric in self.evaluate_stack(img[np.newaxis]))
+
+    @instrumented("SNRMeasurement.evaluate_stack")
+    def evaluate_stack(
+        self, stack: np.ndarray, chunk_bytes: int = DEFAULT_CHUNK_BYTES
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        SNR metrics of every frame of an (N, H, W[, C]) stack or memmap in one pass over memory.
+        Statistics are computed with metrics.moments.Moments, directly on the (integer) frame
+        data; frames are processed in groups whose temporary blocks take about chunk_bytes.
+
+        Returns:
+        arrays (snr, signal, noise, mean_roi, mean_bg) of length N
+        """
+        if stack.shape[1:] != self.shape:
+            raise ValueError(
+                f"Frames have shape {stack.shape[1:]}, expected {self.shape}"
+            )
+
+        n_frames = stack.shape[0]
+        mean_roi = np.empty(n_frames)
+        sigma_S = np.empty(n_frames)
+        mean_bg = np.empty(n_frames)
+        sigma_B = np.empty(n_frames)
+
+        block_bytes = BLOCK_SIZE * np.dtype(np.float64).itemsize
+        frames_per_chunk = max(1, chunk_bytes // block_bytes)
+        for i0 in range(0, n_frames, frames_per_chunk):
+            frames = stack[i0 : i0 + frames_per_chunk]
+            n = frames.shape[0]
+            i1 = i0 + n
+
+            # ROI
+            square = frames[(slice(None),) + self.square].reshape(n, -1)
+            roi = Moments.from_array(square)
+            mean_roi[i0:i1] = roi.mean
+            sigma_S[i0:i1] = roi.std
+
+            # BACKGROUND: the whole frame minus the disk
+            total = Moments.from_array(frames.reshape(n, -1))
+            disk = frames[(slice(None),) + self.disk][:, self.disk_mask]
+            bg = total.subtract(Moments.from_array(disk.reshape(n, -1)))
+            mean_bg[i0:i1] = bg.mean
+            sigma_B[i0:i1] = bg.std
+
+        # Signal
+        signal = mean_roi - mean_bg
+
+        # Noise
+        noise = np.sqrt((sigma_S**2 + sigma_B**2) / 2)
+
+        # SNR
+        snr = signal / noise
+
+        return snr, signal, noise, mean_roi, mean_bg
+
+
+@lru_cache(maxsize=16)
+def _cached_measurement(
+    shape: tuple[int, ...],
+    center: tuple[int, int],
+    radius: int,
+    offset_background: int,
+) -> SNRMeasurement:
+    return SNRMeasurement(shape, center, radius, offset_background)
+
+
+@instrumented()
 def calc_SNR(
     img: np.ndarray,
     center: tuple[int, int],
@@ -17,6 +151,8 @@ def calc_SNR(
     - Noise is the variance of the ROI and background.
     - SNR is the ratio of Signal to Noise.
 
+    The sampling regions are cached per geometry (see SNRMeasurement).
+
     Parameters:
     img (np.ndarray): The input image.
     center ((int, int)): The center of the circular region of interest.
@@ -27,28 +163,12 @@ def calc_SNR(
     Returns:
     float: The Signal-to-Noise Ratio (SNR) of the image.
     """
-    img = img.astype(np.float64)
-
-    s = np.sqrt(2) * radius
-    half_s = s / 2
-    y, x = np.ogrid[: img.shape[0], : img.shape[1]]
-    square_mask = (
-        (x >= center[0] - half_s)
-        & (x <= center[0] + half_s)
-        & (y >= center[1] - half_s)
-        & (y <= center[1] + half_s)
+    measurement = _cached_measurement(
+        img.shape, tuple(center), radius, offset_background
     )
-    square = img[square_mask]
-
-    offset_background = radius if offset_background is None else offset_background
-    y, x = np.ogrid[: img.shape[0], : img.shape[1]]
-    bg_mask = (x - center[0]) ** 2 + (y - center[1]) ** 2 <= (
-        radius + offset_background
-    ) ** 2
-    bg_mask = ~bg_mask
-    bg = img[bg_mask]
 
     if show_sample_position:
+        square_mask, bg_mask = measurement.masks()
         square_mask = square_mask.astype(np.float32)
         bg_mask = bg_mask.astype(np.float32)
         plt.imshow(img)
@@ -66,21 +186,7 @@ def calc_SNR(
         )
         plt.show()
 
-    mean_roi = np.mean(square)
-    mean_bg = np.mean(bg)
-
-    # Signal
-    signal = mean_roi - mean_bg
-
-    # Noise
-    sigma_S = np.std(square, ddof=0)
-    sigma_B = np.std(bg, ddof=0)
-    noise = np.sqrt((sigma_S**2 + sigma_B**2) / 2)
-
-    # SNR
-    snr = signal / noise
-
-    return snr, signal, noise, mean_roi, mean_bg
+    return measurement.evaluate(img)
 
 
 def save_metrics(
@@ -2,20 +2,33 @@ import os
 import numpy as np
 import pandas as pd
 
-from metrics.SNR_metrics import calc_SNR
+from metrics.SNR_metrics import SNRMeasurement
 
 
 def metrics_reliability(
-    images: list[np.ndarray], center: tuple[int, int], radius: int
+    images: list[np.ndarray] | np.ndarray, center: tuple[int, int], radius: int
 ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
-    metrics = []
+    if isinstance(images, np.ndarray):
+        # frame stack or memmap: one batched pass
+        measurement = SNRMeasurement(images.shape[1:], center, radius)
+        snr, signal, noise, _, _ = measurement.evaluate_stack(images)
+        metrics = np.column_stack([snr, signal, noise])
+    else:
+        metrics = []
+        measurement = None
+        for image in images:
+            if measurement is None:
+                measurement = SNRMeasurement(image.shape, center, radius)
+            snr, signal, noise, _, _ = measurement.evaluate(image)
+            metrics.append([snr, signal, noise])
 
-    for image in images:
-        snr, signal, noise, _, _ = calc_SNR(
-            image, center, radius, show_sample_position=False
-        )
-        metrics.append([snr, signal, noise])
+    return reliability_from_metrics(metrics)
 
+
+def reliability_from_metrics(
+    metrics: list[list[float]] | np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Mean, std and cv over images of per-image [SNR, signal, noise] rows."""
     mean = np.mean(metrics, axis=0)
     std = np.std(metrics, axis=0)
     cv = std / mean
@@ -30,3 +43,23 @@ def save_metrics_csv(
         metrics, columns=["SNR", "Signal", "Noise"], index=["mean", "std", "cv"]
     )
     df.to_csv(output_path)
+
+
+def save_metrics_sweep_csv(
+    metrics_by_value: dict[float, tuple[np.ndarray, np.ndarray, np.ndarray]],
+    parameter_name: str,
+    output_path: str,
+) -> None:
+    """
+    Save the metrics_reliability results of a parameter sweep as one table,
+    with one row per parameter value and mean/std/cv columns for SNR, signal and noise.
+    """
+    rows = []
+    for value, (mean, std, cv) in metrics_by_value.items():
+        row = {parameter_name: value}
+        for statistic, values in zip(["mean", "std", "cv"], [mean, std, cv]):
+            for metric, metric_value in zip(["SNR", "Signal", "Noise"], values):
+                row[f"{metric}_{statistic}"] = metric_value
+        rows.append(row)
+
+    pd.DataFrame(rows).to_csv(output_path, index=False)
@@ -0,0 +1,129 @@
+import numpy as np
+
+# elements per row and block in Moments.from_array, bounds the temporary copies
+BLOCK_SIZE = 32768
+
+
+class Moments:
+    """
+    Count, mean and sum of squared deviations (m2) of one or more samples.
+
+    All attributes are arrays of the same (batch) shape, so the statistics of many frames can
+    be computed and combined at once. Partial results of chunks or tiles are combined with
+    merge (and separated again with subtract) using the pairwise update of Chan et al., which
+    is exact up to float rounding and does not lose precision like sum/sum-of-squares formulas.
+    Empty samples have count 0 and NaN mean and m2, like np.mean / np.var of an empty array.
+    """
+
+    def __init__(self, count, mean, m2):
+        self.count = np.asarray(count, dtype=np.float64)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.m2 = np.asarray(m2, dtype=np.float64)
+
+    @classmethod
+    def from_array(cls, data: np.ndarray) -> "Moments":
+        """
+        Moments over the last axis of data, leading axes are kept as the batch shape.
+        Integer data of up to 16 bits is summed exactly in integer arithmetic, without a float
+        copy; other data is processed blockwise with two passes per block.
+        """
+        data = np.asarray(data)
+        if np.issubdtype(data.dtype, np.integer) and data.dtype.itemsize <= 2:
+            return cls._from_integers(data)
+
+        moments = None
+        for start in range(0, max(data.shape[-1], 1), BLOCK_SIZE):
+            block = data[..., start : start + BLOCK_SIZE].astype(np.float64)
+            count = block.shape[-1]
+            if count == 0:
+                return cls._empty(block.shape[:-1])
+            mean = block.mean(axis=-1)
+            block -= mean[..., np.newaxis]
+            m2 = np.einsum("...i,...i->...", block, block)
+            block_moments = cls(np.full(mean.shape, count), mean, m2)
+            moments = block_moments if moments is None else moments.merge(block_moments)
+
+        return moments
+
+    @classmethod
+    def _from_integers(cls, data: np.ndarray) -> "Moments":
+        # squares of 16 bit values fit in 32 bits, so the sums are exact in 64 bit integers
+        # for up to 2**32 elements
+        sum_dtype = (
+            np.int64 if np.issubdtype(data.dtype, np.signedinteger) else np.uint64
+        )
+        total = np.zeros(data.shape[:-1], dtype=sum_dtype)
+        total_of_squares = np.zeros(data.shape[:-1], dtype=np.uint64)
+        for start in range(0, data.shape[-1], BLOCK_SIZE):
+            block = data[..., start : start + BLOCK_SIZE].astype(sum_dtype)
+            total += block.sum(axis=-1, dtype=sum_dtype)
+            total_of_squares += np.einsum("...i,...i->...", block, block).astype(
+                np.uint64
+            )
+
+        count = data.shape[-1]
+        if count == 0:
+            return cls._empty(data.shape[:-1])
+
+        # m2 = (n * sum(x^2) - sum(x)^2) / n, evaluated exactly with Python integers
+        total = total.astype(object)
+        total_of_squares = total_of_squares.astype(object)
+        m2 = (count * total_of_squares - total * total) / count
+        mean = total / count
+
+        return cls(
+            np.full(data.shape[:-1], count),
+            np.asarray(mean, dtype=np.float64),
+            np.asarray(m2, dtype=np.float64),
+        )
+
+    @classmethod
+    def _empty(cls, shape: tuple[int, ...]) -> "Moments":
+        return cls(np.zeros(shape), np.full(shape, np.nan), np.full(shape, np.nan))
+
+    @classmethod
+    def combine(cls, moments: list["Moments"]) -> "Moments":
+        """Merge a list of partial moments."""
+        combined = moments[0]
+        for other in moments[1:]:
+            combined = combined.merge(other)
+        return combined
+
+    def merge(self, other: "Moments") -> "Moments":
+        """Moments of the union of both samples."""
+        count = self.count + other.count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            delta = other.mean - self.mean
+            mean = self.mean + delta * other.count / count
+            m2 = self.m2 + other.m2 + delta**2 * self.count * other.count / count
+        # an empty sample does not change the other one (and two empty ones stay NaN)
+        mean = np.where(self.count == 0, other.mean, mean)
+        m2 = np.where(self.count == 0, other.m2, m2)
+        mean = np.where(other.count == 0, self.mean, mean)
+        m2 = np.where(other.count == 0, self.m2, m2)
+        return Moments(count, mean, m2)
+
+    def subtract(self, other: "Moments") -> "Moments":
+        """Moments of this sample without the sub-sample other (the inverse of merge)."""
+        count = self.count - other.count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = (self.count * self.mean - other.count * other.mean) / count
+            delta = other.mean - mean
+            m2 = self.m2 - other.m2 - delta**2 * count * other.count / self.count
+            m2 = np.maximum(m2, 0.0)
+        # nothing left is an empty sample, removing an empty sample changes nothing
+        mean = np.where(count == 0, np.nan, mean)
+        m2 = np.where(count == 0, np.nan, m2)
+        mean = np.where(other.count == 0, self.mean, mean)
+        m2 = np.where(other.count == 0, self.m2, m2)
+        return Moments(count, mean, m2)
+
+    @property
+    def variance(self) -> np.ndarray:
+        """Population variance (ddof=0)."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.m2 / self.count
+
+    @property
+    def std(self) -> np.ndarray:
+        return np.sqrt(self.variance)
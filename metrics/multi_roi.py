@@ -0,0 +1,111 @@
+from functools import lru_cache
+
+import numpy as np
+
+from metrics.moments import Moments
+
+
+class MultiROIMeasurement:
+    """
+    Mean intensities of many circular ROIs (e.g. the wells of an assay plate) and of the shared
+    background, for one image shape and well geometry.
+
+    The wells are rasterized once into a label image (0 = background, i + 1 = well i), so one
+    np.bincount pass over a frame gives the sums of all wells and of the background. Pixels
+    covered by more than one well are counted for each of them: such wells are evaluated on
+    their bounding box instead. Images may have a trailing channel dimension, whose values
+    are pooled per ROI.
+    - centers: (x, y) per well
+    - diameters: diameter per well, pixels within diameter / 2 of the center belong to the well
+    """
+
+    def __init__(
+        self,
+        shape: tuple[int, ...],
+        centers: list[tuple[float, float]],
+        diameters: list[float],
+    ):
+        self.shape = tuple(shape)
+        height, width = self.shape[:2]
+        self.n_wells = len(centers)
+
+        self.labels = np.zeros((height, width), dtype=np.int32)
+        covered = np.zeros((height, width), dtype=np.uint16)
+        self.boxes = []
+        for i, ((center_x, center_y), diameter) in enumerate(zip(centers, diameters)):
+            box, well_mask = self._well_box(center_x, center_y, diameter / 2)
+            self.boxes.append((box, well_mask))
+            self.labels[box][well_mask] = i + 1
+            covered[box] += well_mask
+
+        # wells sharing pixels with another well
+        overlapping = covered > 1
+        self.overlapping_wells = [
+            i
+            for i, (box, well_mask) in enumerate(self.boxes)
+            if np.any(overlapping[box] & well_mask)
+        ]
+
+        self.counts = np.bincount(self.labels.ravel(), minlength=self.n_wells + 1)
+        for i in self.overlapping_wells:
+            self.counts[i + 1] = int(self.boxes[i][1].sum())
+
+    def _well_box(
+        self, center_x: float, center_y: float, radius: float
+    ) -> tuple[tuple[slice, slice], np.ndarray]:
+        height, width = self.shape[:2]
+        x0 = min(max(int(np.ceil(center_x - radius)), 0), width)
+        x1 = min(max(int(np.floor(center_x + radius)) + 1, x0), width)
+        y0 = min(max(int(np.ceil(center_y - radius)), 0), height)
+        y1 = min(max(int(np.floor(center_y + radius)) + 1, y0), height)
+        y, x = np.ogrid[y0:y1, x0:x1]
+        distance = np.sqrt((x - center_x) ** 2 + (y - center_y) ** 2)
+        return (slice(y0, y1), slice(x0, x1)), distance <= radius
+
+    def well_mask(self, i: int) -> np.ndarray:
+        """Full-frame boolean mask of well i, e.g. for plotting."""
+        box, well_mask = self.boxes[i]
+        mask = np.zeros(self.shape[:2], dtype=bool)
+        mask[box] = well_mask
+        return mask
+
+    def background_mask(self) -> np.ndarray:
+        return self.labels == 0
+
+    def evaluate(self, img: np.ndarray) -> tuple[np.ndarray, float, float]:
+        """
+        Returns:
+        (mean per well, mean of the background, standard deviation of the whole image)
+        """
+        if img.shape != self.shape:
+            raise ValueError(f"Image has shape {img.shape}, expected {self.shape}")
+
+        n_channels = int(np.prod(self.shape[2:]))
+        channels = img.reshape(self.shape[0] * self.shape[1], n_channels)
+        labels = self.labels.ravel()
+
+        sums = np.zeros(self.n_wells + 1)
+        for c in range(n_channels):
+            sums += np.bincount(
+                labels, weights=channels[:, c], minlength=self.n_wells + 1
+            )
+
+        for i in self.overlapping_wells:
+            box, well_mask = self.boxes[i]
+            sums[i + 1] = img[box][well_mask].sum(dtype=np.float64)
+
+        means = sums / (self.counts * n_channels)
+
+        std = Moments.from_array(img.reshape(1, -1)).std[0]
+
+        return means[1:], means[0], std
+
+
+@lru_cache(maxsize=16)
+def cached_multi_roi_measurement(
+    shape: tuple[int, ...],
+    centers: tuple[tuple[float, float], ...],
+    diameters: tuple[float, ...],
+) -> MultiROIMeasurement:
+    """MultiROIMeasurement per geometry, so images of the same plate layout share the label image."""
+    return MultiROIMeasurement(shape, centers, diameters)
@@ -0,0 +1,265 @@
+import os
+import json
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CHUNK_SIZE = 1000
+FORMATS = ("csv", "parquet")
+PARAMS_SUFFIX = ".params.json"
+
+
+def _column_dtype(values) -> np.dtype:
+    # numbers and booleans are buffered typed, everything else (strings, None) as objects
+    dtype = np.asarray(values).dtype
+    return dtype if dtype.kind in "biuf" else np.dtype(object)
+
+
+def params_hash(params: dict) -> str:
+    return hashlib.sha256(
+        json.dumps(params, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+class ResultsSink:
+    """
+    Collects result rows in typed numpy column buffers, preallocated per chunk, and writes
+    them in chunks, instead of growing a DataFrame row by row with pd.concat.
+
+    Rows are flushed every chunk_size rows and when the sink is closed, so it is used as a
+    context manager:
+
+        with ResultsSink(
+            output_path, ["image", "ROI", "BG"], key="image", resume=True, params=params
+        ) as sink:
+            for filename in filenames:
+                if sink.done(filename):
+                    continue
+                sink.append(image=filename, ROI=mean_roi, BG=mean_bg)
+
+    - path: .csv or .parquet file, None collects in memory only. CSV chunks are appended and
+      synced as they are flushed; Parquet (needs pyarrow) is only complete once the sink is
+      closed, so use CSV where a run has to survive crashes
+    - key: column identifying a unit of work; with resume=True rows already written by an
+      earlier (e.g. crashed) run are kept and done(value) reports whether to skip a value
+    - resume: keep and extend an existing file, by default it is overwritten
+    - params: parameters the rows depend on (e.g. center, radius, offset). Their hash is saved
+      next to the file (<path>.params.json) and resuming a file written with other or unknown
+      parameters raises a ValueError instead of keeping stale rows
+    """
+
+    def __init__(
+        self,
+        path: str | None,
+        columns: list[str],
+        key: str = None,
+        resume: bool = False,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        params: dict = None,
+    ):
+        if key is not None and key not in columns:
+            raise ValueError(f"Key column {key} is not one of {columns}")
+
+        self.path = path
+        self.columns = list(columns)
+        self.key = key
+        self.chunk_size = chunk_size
+        self.format = None if path is None else self._format(path)
+
+        self._buffer = {}
+        self._n_buffered = 0
+        self._chunks = []  # flushed chunks of an in-memory sink
+        self._parquet_writer = None
+        self._done = set()
+
+        if self.format == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise ImportError("Writing Parquet results requires pyarrow") from None
+
+        if path is not None:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            if resume and os.path.exists(path):
+                self._check_params(params)
+                self._resume()
+            elif os.path.exists(path):
+                os.remove(path)
+            self._save_params(params)
+
+    @staticmethod
+    def _format(path: str) -> str:
+        extension = os.path.splitext(path)[1].lower().lstrip(".")
+        if extension not in FORMATS:
+            raise ValueError(f"Unsupported results format {extension}, use {FORMATS}")
+        return extension
+
+    def _params_path(self) -> str:
+        return self.path + PARAMS_SUFFIX
+
+    def _check_params(self, params: dict | None) -> None:
+        if params is None:
+            return
+        stored = None
+        if os.path.exists(self._params_path()):
+            with open(self._params_path()) as f:
+                stored = json.load(f).get("hash")
+        if stored != params_hash(params):
+            raise ValueError(
+                f"{self.path} was written with other parameters than {params}, "
+                "remove it or run without resume"
+            )
+
+    def _save_params(self, params: dict | None) -> None:
+        if params is None:
+            if os.path.exists(self._params_path()):
+                os.remove(self._params_path())
+            return
+        with open(self._params_path(), "w") as f:
+            json.dump({"hash": params_hash(params), "params": params}, f, default=str)
+
+    def _resume(self) -> None:
+        if self.format == "csv":
+            # drop a last row that was only partially written
+            with open(self.path, "rb+") as f:
+                content = f.read()
+                if content and not content.endswith(b"\n"):
+                    f.truncate(content.rfind(b"\n") + 1)
+            if os.path.getsize(self.path) == 0:
+                return
+            existing = pd.read_csv(self.path)
+        else:
+            existing = pd.read_parquet(self.path)
+
+        if list(existing.columns) != self.columns:
+            raise ValueError(
+                f"{self.path} has columns {list(existing.columns)}, expected {self.columns}"
+            )
+        if self.key is not None:
+            self._done.update(existing[self.key])
+
+    def done(self, key_value) -> bool:
+        """Whether rows for this key value have already been collected."""
+        return key_value in self._done
+
+    def append(self, **row) -> None:
+        """Add one row given as column=value."""
+        self.extend({column: [value] for column, value in row.items()})
+
+    def extend(self, rows: dict[str, list]) -> None:
+        """
+        Add several rows given as {column: values}. The rows are added together, so all rows
+        of one unit of work (e.g. all wells of an image) are written in the same chunk.
+        """
+        if set(rows) != set(self.columns):
+            raise ValueError(f"Rows have columns {list(rows)}, expected {self.columns}")
+        lengths = {len(values) for values in rows.values()}
+        if len(lengths) != 1:
+            raise ValueError("All columns need the same number of values")
+
+        n_rows = lengths.pop()
+        start, end = self._n_buffered, self._n_buffered + n_rows
+        for column in self.columns:
+            values = rows[column]
+            dtype = _column_dtype(values)
+            buffer = self._buffer.get(column)
+            if buffer is None:
+                buffer = np.empty(max(self.chunk_size, n_rows), dtype=dtype)
+            else:
+                if dtype != buffer.dtype:
+                    if dtype.kind in "biuf" and buffer.dtype.kind in "biuf":
+                        dtype = np.promote_types(buffer.dtype, dtype)
+                    else:
+                        dtype = np.dtype(object)
+                    buffer = buffer.astype(dtype)
+                if end > len(buffer):
+                    buffer = np.concatenate(
+                        [buffer, np.empty(end - len(buffer), dtype=buffer.dtype)]
+                    )
+            buffer[start:end] = values
+            self._buffer[column] = buffer
+        self._n_buffered = end
+        if self.key is not None:
+            self._done.update(rows[self.key])
+
+        if self._n_buffered >= self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._n_buffered == 0:
+            return
+
+        chunk = pd.DataFrame(
+            {
+                column: self._buffer[column][: self._n_buffered]
+                for column in self.columns
+            },
+            columns=self.columns,
+            copy=True,
+        )
+        self._buffer = {}
+        self._n_buffered = 0
+
+        if self.format == "csv":
+            write_header = not os.path.exists(self.path) or (
+                os.path.getsize(self.path) == 0
+            )
+            with open(self.path, "a", newline="") as f:
+                f.write(chunk.to_csv(index=False, header=write_header))
+                f.flush()
+                os.fsync(f.fileno())
+        elif self.format == "parquet":
+            self._write_parquet(chunk)
+        else:
+            self._chunks.append(chunk)
+
+    def _write_parquet(self, chunk: pd.DataFrame) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._parquet_writer is None:
+            # Parquet files cannot be appended to: rows already in the file are rewritten
+            # first, the writer then stays open until close
+            if os.path.exists(self.path):
+                chunk = pd.concat(
+                    [pd.read_parquet(self.path), chunk], ignore_index=True
+                )
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table)
+        else:
+            self._parquet_writer.write_table(
+                pa.Table.from_pandas(
+                    chunk, schema=self._parquet_writer.schema, preserve_index=False
+                )
+            )
+
+    def close(self) -> None:
+        self.flush()
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """All collected rows, including rows of a resumed file."""
+        self.close()
+        if self.format == "csv":
+            if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+                return pd.DataFrame(columns=self.columns)
+            return pd.read_csv(self.path)
+        if self.format == "parquet":
+            if not os.path.exists(self.path):
+                return pd.DataFrame(columns=self.columns)
+            return pd.read_parquet(self.path)
+
+        if not self._chunks:
+            return pd.DataFrame(columns=self.columns)
+        return pd.concat(self._chunks, ignore_index=True)
+
+    def __enter__(self) -> "ResultsSink":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
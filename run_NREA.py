@@ -1,14 +1,19 @@
 import os
-from PIL import Image
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-import matplotlib.cm as cm
 import click
 
-from denoising.NREA import NREA
+from denoising.NREA import NREA_frames
 from metrics.SNR_metrics import calc_SNR
-from helpers.helpers import load_images_from_folder
+from helpers.frame_stack import (
+    iter_frames,
+    count_frames,
+    stack_base_dir,
+    shifts_cache_path,
+)
+from helpers.registration import align_frames
+from helpers.helpers import save_tiff_16bit
 from helpers.CLI_options import (
     input_dir_option,
     is_raw_option,
@@ -19,9 +24,11 @@ from helpers.CLI_options import (
     kernel_size_option,
     accumulate_option,
     normalize_option,
+    n_workers_option,
+    align_option,
 )
 
-colormap = cm.get_cmap("tab10")
+colormap = plt.get_cmap("tab10")
 
 
 @click.command()
@@ -34,6 +41,8 @@ colormap = cm.get_cmap("tab10")
 @kernel_size_option
 @accumulate_option
 @normalize_option
+@n_workers_option
+@align_option
 def run_NREA(
     input_dir: str,
     is_raw: bool,
@@ -44,45 +53,56 @@ def run_NREA(
     kernel_size: int,
     accumulate: bool = True,  # true: images 0:i are used, false: only image i is used for i-th iteration
     normalize: bool = True,
+    n_workers: int = None,
+    align: bool = False,
 ):
     # LOAD IMAGES
     center = (center_x, center_y)
     file_format = "dng" if is_raw else "tiff"
-    images, filenames = load_images_from_folder(
-        input_dir, file_format=file_format, bit_depth=16
+    n = count_frames(input_dir, file_format=file_format)
+    frames = iter_frames(
+        input_dir, file_format=file_format, bit_depth=16, n_workers=n_workers
     )
+    if align:
+        frames = align_frames(
+            frames, cache_path=shifts_cache_path(input_dir), n_workers=n_workers
+        )
 
     output_dir = (
-        input_dir
+        stack_base_dir(input_dir)
         + "/NREA"
         + f"_{kernel}_{kernel_size}"
         + ("_accumulated" if accumulate else "_single")
+        + ("_aligned" if align else "")
     )
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    n = len(images)
     metrics = np.zeros((n, 3))
 
-    for i in range(n):
-        # do NREA with i images
-        nrea = NREA(
-            images[: i + 1] if accumulate else [images[i]],
-            gaussian_blurring=(kernel == "GB"),
-            kernel_radius=kernel_size,
-        )
+    filenames = []
+
+    def images():
+        for filename, image in frames:
+            filenames.append(filename)
+            yield image
+
+    nrea_frames = NREA_frames(
+        images(),
+        gaussian_blurring=(kernel == "GB"),
+        kernel_radius=kernel_size,
+        accumulate=accumulate,
+        normalize=normalize,
+    )
+    for i, nrea in enumerate(nrea_frames):
+        filename = filenames[i]
 
         # save as tiff
         output_path = os.path.join(
             output_dir,
-            filenames[i].split(".")[0] + ("_normalized" if normalize else "") + ".tiff",
+            filename.split(".")[0] + ("_normalized" if normalize else "") + ".tiff",
         )
-        nrea_normalized = (
-            (nrea - np.min(nrea)) / (np.max(nrea) - np.min(nrea))
-        ) * 2**16
-        nrea = nrea_normalized if normalize else nrea
-        im = Image.fromarray(nrea.astype(np.uint16), mode="I;16")
-        im.save(output_path)
+        save_tiff_16bit(nrea, output_path)
 
         # calculate SNR
         snr, signal, noise, _, _ = calc_SNR(
@@ -2,22 +2,22 @@ import os
 import re
 import pandas as pd
 import matplotlib.pyplot as plt
-import matplotlib.cm as cm
 import click
 from PIL import Image
 
-from denoising.NREA import NREA
+from denoising.NREA_sweep import NREA_sweep
 from metrics.SNR_metrics import calc_SNR, save_metrics_csv
-from helpers.helpers import load_images_from_folder
+from helpers.frame_stack import iter_frames, stack_base_dir
 from helpers.CLI_options import (
     input_dir_option,
     is_raw_option,
     center_x_option,
     center_y_option,
     radius_option,
+    n_workers_option,
 )
 
-colormap = cm.get_cmap("tab20")
+colormap = plt.get_cmap("tab20")
 
 
 def plot_snr_comparison(class_x_data, class_y_data, output_dir):
@@ -107,22 +107,31 @@ def plot_class_comparison(class_data, class_name, output_dir):
 @center_x_option
 @center_y_option
 @radius_option
+@n_workers_option
 def run_NREA_filter_comparison(
-    input_dir: str, is_raw: bool, center_x: int, center_y: int, radius: int
+    input_dir: str,
+    is_raw: bool,
+    center_x: int,
+    center_y: int,
+    radius: int,
+    n_workers: int = None,
 ):
-    output_dir = input_dir + "/NREA_filter_comparison"
+    output_dir = stack_base_dir(input_dir) + "/NREA_filter_comparison"
 
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
     # Load images
     file_format = "dng" if is_raw else "tiff"
-    images, _ = load_images_from_folder(
-        input_dir, file_format=file_format, bit_depth=16
+    frames = iter_frames(
+        input_dir, file_format=file_format, bit_depth=16, n_workers=n_workers
     )
 
-    # run NREA for different filters
+    # run NREA for different filters, every frame is loaded and converted only once
     kernel_radii = [10, 25, 50, 75, 100, 150, 200]
+    nrea_images = NREA_sweep(
+        (image for _, image in frames), kernel_radii, n_workers=n_workers
+    )
 
     center = (center_x, center_y)
 
@@ -130,8 +139,8 @@ def run_NREA_filter_comparison(
     gb_data = []
 
     for kernel_radius in kernel_radii:
-        nrea_ca = NREA(images, gaussian_blurring=False, kernel_radius=kernel_radius)
-        nrea_gb = NREA(images, gaussian_blurring=True, kernel_radius=kernel_radius)
+        nrea_ca = nrea_images[(False, kernel_radius)]
+        nrea_gb = nrea_images[(True, kernel_radius)]
 
         snr, signal, noise, _, _ = calc_SNR(nrea_ca, center, radius)
         output_path = os.path.join(
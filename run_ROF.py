@@ -1,12 +1,9 @@
 import os
-from PIL import Image
-from tqdm import tqdm
 import click
-import numpy as np
 
-from denoising.ROF import ROF_denoising
+from denoising.ROF import ROF_denoising_parallel
 from metrics.metrics_reliability import metrics_reliability, save_metrics_csv
-from helpers.helpers import load_images_from_folder
+from helpers.helpers import iter_images_from_folder, save_tiff_16bit
 from helpers.CLI_options import (
     input_dir_option,
     is_raw_option,
@@ -14,6 +11,8 @@ from helpers.CLI_options import (
     center_y_option,
     radius_option,
     weight_option,
+    n_workers_option,
+    tile_size_option,
 )
 
 
@@ -24,6 +23,8 @@ from helpers.CLI_options import (
 @center_y_option
 @radius_option
 @weight_option
+@n_workers_option
+@tile_size_option
 def run_ROF_denoising(
     input_dir: str,
     is_raw: bool,
@@ -31,6 +32,8 @@ def run_ROF_denoising(
     center_y: int,
     radius: int,
     weight: float,
+    n_workers: int = None,
+    tile_size: int = 0,
 ):
     output_dir = input_dir + "/ROF_denoised_" + str(weight).replace(".", "_") + "_16bit"
 
@@ -39,23 +42,33 @@ def run_ROF_denoising(
 
     # LOAD IMAGES
     file_format = "dng" if is_raw else "tiff"
-    images, filenames = load_images_from_folder(
-        input_dir, file_format=file_format, bit_depth=16
+    frames = iter_images_from_folder(
+        input_dir, file_format=file_format, bit_depth=16, n_workers=n_workers
     )
 
     center = (center_x, center_y)
 
+    filenames = []
+
+    def images():
+        for filename, image in frames:
+            filenames.append(filename)
+            yield image
+
+    denoised_frames = ROF_denoising_parallel(
+        images(), weight=weight, n_workers=n_workers, tile_size=tile_size or None
+    )
+
     denoised_images = []
-    for i, image in tqdm(enumerate(images), desc="Denoising images", total=len(images)):
-        denoised_image = ROF_denoising(image, weight=weight)
+    for i, denoised_image in enumerate(denoised_frames):
+        filename = filenames[i]
 
         denoised_images.append(denoised_image)
 
         # save image as tiff
-        output_path = os.path.join(output_dir, filenames[i])
+        output_path = os.path.join(output_dir, filename)
 
-        im = Image.fromarray(denoised_image.astype(np.uint16), mode="I;16")
-        im.save(output_path.replace("dng", "tiff"))
+        save_tiff_16bit(denoised_image, output_path.replace("dng", "tiff"))
 
     # metrics reliability
     mean, std, cv = metrics_reliability(denoised_images, center, radius)
@@ -0,0 +1,78 @@
+import os
+import click
+
+from denoising.ROF import ROF_weight_sweep_parallel
+from metrics.SNR_metrics import SNRMeasurement
+from metrics.metrics_reliability import (
+    reliability_from_metrics,
+    save_metrics_sweep_csv,
+)
+from helpers.frame_stack import iter_frames, stack_base_dir
+from helpers.CLI_options import (
+    input_dir_option,
+    is_raw_option,
+    center_x_option,
+    center_y_option,
+    radius_option,
+    weights_option,
+    n_workers_option,
+)
+
+
+@click.command()
+@input_dir_option
+@is_raw_option
+@center_x_option
+@center_y_option
+@radius_option
+@weights_option
+@n_workers_option
+def run_ROF_weight_sweep(
+    input_dir: str,
+    is_raw: bool,
+    center_x: int,
+    center_y: int,
+    radius: int,
+    weights: str,
+    n_workers: int = None,
+):
+    """
+    Denoise the burst with several ROF weights, loading every frame only once,
+    and save SNR/signal/noise per weight to ROF_weight_sweep.csv.
+    Metrics are calculated as the denoised frames come in, only they are kept per weight.
+    - input_dir: folder of images, '.stack' file or multi-page TIFF
+    """
+    weights = [float(weight) for weight in weights.split(",")]
+
+    # LOAD IMAGES
+    file_format = "dng" if is_raw else "tiff"
+    frames = iter_frames(
+        input_dir, file_format=file_format, bit_depth=16, n_workers=n_workers
+    )
+    images = (image for _, image in frames)
+
+    center = (center_x, center_y)
+
+    # SNR, signal and noise per frame and weight
+    metrics_per_weight = {weight: [] for weight in weights}
+    measurement = None
+    for denoised_per_weight in ROF_weight_sweep_parallel(images, weights, n_workers):
+        for weight, denoised_image in zip(weights, denoised_per_weight):
+            if measurement is None or measurement.shape != denoised_image.shape:
+                measurement = SNRMeasurement(denoised_image.shape, center, radius)
+            snr, signal, noise, _, _ = measurement.evaluate(denoised_image)
+            metrics_per_weight[weight].append([snr, signal, noise])
+
+    # metrics reliability per weight
+    metrics = {
+        weight: reliability_from_metrics(metrics_per_weight[weight])
+        for weight in weights
+    }
+
+    output_dir = stack_base_dir(input_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    save_metrics_sweep_csv(metrics, "weight", output_dir + "/ROF_weight_sweep.csv")
+
+
+if __name__ == "__main__":
+    run_ROF_weight_sweep()
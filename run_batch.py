@@ -0,0 +1,260 @@
+import os
+import json
+import time
+import inspect
+import warnings
+import importlib
+
+import matplotlib
+
+# no windows: plt.show() returns immediately, also in spawned worker processes
+os.environ["MPLBACKEND"] = "Agg"
+matplotlib.use("Agg")
+
+import click
+import pandas as pd
+from tqdm import tqdm
+
+from metrics.results_sink import ResultsSink
+from helpers.frame_stack import stack_base_dir
+from helpers.parallel import bounded_imap
+from helpers.CLI_options import manifest_option, n_workers_option
+
+# commands that can be run from a manifest, as module:command
+COMMANDS = {
+    "run_NREA": "run_NREA:run_NREA",
+    "run_NREA_filter_comparison": "run_NREA_filter_comparison:run_NREA_filter_comparison",
+    "run_ROF": "run_ROF:run_ROF_denoising",
+    "run_ROF_weight_sweep": "run_ROF_weight_sweep:run_ROF_weight_sweep",
+    "run_image_stacking": "run_image_stacking:run_image_stacking",
+    "calc_metrics_reliability": "calc_metrics_reliability:calc_metrics_reliability",
+    "full_pipeline": "run_full_pipeline:full_pipeline",
+}
+
+METRIC_COLUMNS = ["SNR", "Signal", "Noise"]
+SUMMARY_COLUMNS = [
+    "job",
+    "command",
+    "input_dir",
+    "status",
+    "error",
+    "duration_s",
+    "outputs",
+    "metrics",
+]
+
+# options without a default are marked with a sentinel instead of None by newer click versions
+_UNSET = getattr(click.core, "UNSET", None)
+
+
+def load_manifest(manifest_path: str) -> list[dict]:
+    """
+    Jobs of a manifest, one dict of command and parameters per job.
+    - CSV: one row per job, a command column and one column per parameter; empty cells are not set
+    - YAML (needs PyYAML) / JSON: a list of jobs, or {"defaults": {...}, "jobs": [...]} where
+      the defaults apply to every job
+    Parameters are named like the options of the command (e.g. input_dir, kernel_size).
+    """
+    extension = os.path.splitext(manifest_path)[1].lower()
+    if extension == ".csv":
+        df = pd.read_csv(manifest_path, dtype=str, keep_default_na=False)
+        jobs = [
+            {column: value for column, value in row.items() if value != ""}
+            for row in df.to_dict(orient="records")
+        ]
+    elif extension in (".yaml", ".yml", ".json"):
+        with open(manifest_path) as f:
+            if extension == ".json":
+                content = json.load(f)
+            else:
+                try:
+                    import yaml
+                except ImportError:
+                    raise ImportError("YAML manifests require PyYAML") from None
+                content = yaml.safe_load(f)
+
+        defaults = {}
+        if isinstance(content, dict):
+            defaults = content.get("defaults", {})
+            content = content.get("jobs", [])
+        jobs = [{**defaults, **job} for job in content]
+    else:
+        raise ValueError(f"Unsupported manifest format {extension}, use CSV or YAML")
+
+    for i, job in enumerate(jobs):
+        if job.get("command") not in COMMANDS:
+            raise ValueError(
+                f"Job {i + 1}: unknown command {job.get('command')}, use one of {list(COMMANDS)}"
+            )
+    return jobs
+
+
+def _load_command(name: str) -> click.Command:
+    module_name, command_name = COMMANDS[name].split(":")
+    return getattr(importlib.import_module(module_name), command_name)
+
+
+def _command_params(command: click.Command, params: dict, ctx: click.Context) -> dict:
+    """Parameters converted by the option types, options that are not given use their defaults."""
+    options = {param.name: param for param in command.params}
+    unknown = set(params) - set(options)
+    if unknown:
+        raise click.UsageError(
+            f"Unknown parameters {sorted(unknown)} for {command.name}"
+        )
+
+    signature = inspect.signature(command.callback).parameters
+    missing = [
+        name
+        for name, option in options.items()
+        if name not in params
+        and option.default in (None, _UNSET)
+        and signature[name].default is inspect.Parameter.empty
+    ]
+    if missing:
+        raise click.UsageError(f"Missing parameters {missing} for {command.name}")
+
+    return {
+        name: options[name].type_cast_value(ctx, value)
+        for name, value in params.items()
+    }
+
+
+def _csv_files(output_dir: str) -> dict[str, int]:
+    files = {}
+    for root, _, filenames in os.walk(output_dir):
+        for filename in filenames:
+            if filename.endswith(".csv"):
+                path = os.path.join(root, filename)
+                files[path] = os.stat(path).st_mtime_ns
+    return files
+
+
+def _output_metrics(output_dir: str, before: dict[str, int]) -> tuple[list[str], dict]:
+    # CSV files the job created or changed, with the metrics of those that contain SNR / signal / noise
+    outputs, metrics = [], {}
+    for path, mtime in sorted(_csv_files(output_dir).items()):
+        if before.get(path) == mtime:
+            continue
+        relative_path = os.path.relpath(path, output_dir)
+        outputs.append(relative_path)
+
+        df = pd.read_csv(path, index_col=0)
+        columns = [column for column in METRIC_COLUMNS if column in df.columns]
+        if not columns or df.empty:
+            continue
+        # mean of metrics_reliability tables, otherwise the last image / epoch
+        row = df.loc["mean"] if "mean" in df.index else df.iloc[-1]
+        metrics[relative_path] = {column: float(row[column]) for column in columns}
+    return outputs, metrics
+
+
+def run_job(task: tuple[int, dict]) -> dict:
+    """Run one manifest job without prompts and return its summary row, errors are reported there."""
+    job_id, job = task
+    params = {key: value for key, value in job.items() if key != "command"}
+    input_dir = params.get("input_dir", "")
+    row = {
+        "job": job_id,
+        "command": job["command"],
+        "input_dir": input_dir,
+        "status": "ok",
+        "error": "",
+        "outputs": "",
+        "metrics": "",
+    }
+
+    output_dir = stack_base_dir(str(input_dir)) if input_dir else None
+
+    wall_start = time.perf_counter()
+    try:
+        before = _csv_files(output_dir) if output_dir else {}
+        command = _load_command(job["command"])
+        ctx = click.Context(command, info_name=command.name)
+        with ctx, warnings.catch_warnings():
+            warnings.filterwarnings("ignore", message=".*non-interactive.*")
+            ctx.invoke(command, **_command_params(command, params, ctx))
+    except (Exception, SystemExit) as e:
+        row["status"] = "failed"
+        row["error"] = f"{type(e).__name__}: {e}"
+    row["duration_s"] = time.perf_counter() - wall_start
+
+    if row["status"] == "ok" and output_dir and os.path.isdir(output_dir):
+        try:
+            outputs, metrics = _output_metrics(output_dir, before)
+        except Exception as e:
+            # e.g. an unreadable or half-written CSV, reported like a failed run
+            row["status"] = "failed"
+            row["error"] = f"Reading outputs: {type(e).__name__}: {e}"
+        else:
+            row["outputs"] = ";".join(outputs)
+            row["metrics"] = json.dumps(metrics) if metrics else ""
+
+    return row
+
+
+def run_dataset_jobs(tasks: list[tuple[int, dict]]) -> list[dict]:
+    """Run the jobs of one dataset one after another, so their outputs do not get mixed up."""
+    return [run_job(task) for task in tasks]
+
+
+@click.command()
+@manifest_option
+@n_workers_option
+def run_batch(manifest: str, n_workers: int):
+    """
+    Run the jobs of a manifest (see load_manifest), e.g. run_NREA, run_ROF or run_image_stacking
+    for many datasets, without prompts or plot windows. Jobs of different datasets run
+    concurrently on n_workers processes, jobs of the same dataset one after another; jobs that
+    do not set n_workers themselves then use a single worker each.
+    Status, duration, written CSV files and their SNR / signal / noise are saved per job to
+    <manifest>_summary.csv and <manifest>_summary.json. Failed jobs do not stop the batch.
+    """
+    jobs = load_manifest(manifest)
+
+    if n_workers is None or n_workers > 1:
+        for job in jobs:
+            try:
+                command = _load_command(job["command"])
+            except Exception:
+                continue  # reported as failed job
+            if "n_workers" in {param.name for param in command.params}:
+                job.setdefault("n_workers", 1)
+
+    summary_path = os.path.splitext(manifest)[0] + "_summary"
+    with ResultsSink(
+        summary_path + ".csv", SUMMARY_COLUMNS, resume=False, chunk_size=1
+    ) as sink:
+        # jobs of different datasets run concurrently
+        datasets = {}
+        for task in enumerate(jobs, start=1):
+            dataset = stack_base_dir(str(task[1].get("input_dir", "")))
+            datasets.setdefault(dataset, []).append(task)
+
+        progress = tqdm(desc="Running jobs", total=len(jobs))
+        for rows in bounded_imap(run_dataset_jobs, datasets.values(), n_workers):
+            for row in rows:
+                sink.append(**row)
+                if row["status"] != "ok":
+                    print(f"Job {row['job']} ({row['command']}) failed: {row['error']}")
+            progress.update(len(rows))
+        progress.close()
+
+        summary = sink.to_dataframe()
+
+    records = summary.fillna("").to_dict(orient="records")
+    for record in records:
+        record["outputs"] = record["outputs"].split(";") if record["outputs"] else []
+        record["metrics"] = json.loads(record["metrics"]) if record["metrics"] else {}
+    with open(summary_path + ".json", "w") as f:
+        json.dump(records, f, indent=2)
+
+    n_failed = int((summary["status"] != "ok").sum())
+    print(
+        f"{len(summary) - n_failed} of {len(summary)} jobs succeeded, "
+        f"summary saved to {summary_path}.csv / .json"
+    )
+
+
+if __name__ == "__main__":
+    run_batch()
@@ -1,11 +1,26 @@
 import os
+import re
 import click
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 
-from cropping import crop
-from calc_metrics_for_folder import calc_metrics_for_folder
+from cropping import crop, iter_cropped_frames
+from calc_metrics_for_folder import calc_metrics_for_folder, calc_metrics
+from denoising.ROF import ROF_denoising_parallel
+from denoising.NREA import NREA_frames
+from metrics.metrics_reliability import metrics_reliability, save_metrics_csv
 from run_ROF import run_ROF_denoising
 from run_NREA import run_NREA
+from helpers.helpers import list_image_files, save_tiff_16bit
+from helpers.stage_cache import run_stage, hash_key, fingerprint_files
+from helpers.parallel import run_task_graph
+from helpers.instrumentation import (
+    enable_profiling,
+    disable_profiling,
+    instrumented,
+    write_report,
+)
 
 from helpers.CLI_options import (
     input_dir_option,
@@ -15,31 +30,63 @@ from helpers.CLI_options import (
     radius_option,
     offset_option,
     crop_factor_option,
+    bayer_option,
     kernel_option,
     kernel_size_option,
     accumulate_option,
     normalize_option,
     weight_option,
+    use_cache_option,
+    in_memory_option,
+    write_intermediate_option,
+    n_workers_option,
+    profile_option,
 )
 
+DF_COL_PREFIXES = ["RAW_", "ROF_", "NREA_", "NREA_ROF_"]
 
-@click.command()
-@input_dir_option
-@crop_factor_option
-@format_option
-@center_x_option
-@center_y_option
-@radius_option
-@offset_option
-@weight_option
-@kernel_option
-@kernel_size_option
-@accumulate_option
-@normalize_option
-def full_pipeline(
+
+def _frame_number(tiff_name: str) -> int:
+    # cropped_<n>[_normalized].tiff is the n-th image in crop order
+    match = re.match(r"cropped_(\d+)", tiff_name)
+    if match is None:
+        raise ValueError(f"{tiff_name} is not a cropped frame")
+    return int(match.group(1))
+
+
+def metrics_overview(filenames: list[str], dfs: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    One table of the metrics of the cropped, ROF, NREA and NREA of ROF images.
+    - filenames: source images in crop order
+    - dfs: metrics per stage indexed by the TIFF names of the frames (cropped_<n>...tiff),
+      rows are matched to filenames by n
+    """
+    frame_numbers = range(1, len(filenames) + 1)
+    df_channel = pd.DataFrame({"image": filenames})
+    for prefix, df in zip(DF_COL_PREFIXES, dfs):
+        df = df.copy()
+        df.index = [_frame_number(name) for name in df.index]
+        df = df.reindex(frame_numbers).reset_index(drop=True)
+        df.columns = [prefix + col for col in df.columns]
+        df_channel = pd.concat([df_channel, df], axis=1)
+    return df_channel
+
+
+def _tiff_names(n_frames: int, suffix: str = "") -> list[str]:
+    return [f"cropped_{i + 1}{suffix}.tiff" for i in range(n_frames)]
+
+
+def save_tiffs(frames: np.ndarray, output_dir: str, filenames: list[str]) -> None:
+    os.makedirs(output_dir, exist_ok=True)
+    for filename, frame in zip(filenames, frames):
+        save_tiff_16bit(frame, os.path.join(output_dir, filename))
+
+
+def full_pipeline_in_memory(
     input_dir: str,
     crop_factor: int,
-    format: str,
+    bayer: bool,
+    file_format: str,
     center_x: int,
     center_y: int,
     radius: int,
@@ -49,22 +96,184 @@ def full_pipeline(
     accumulate: bool,
     normalize: bool,
     weight: float,
-):
+    n_workers: int = None,
+    write_intermediate: bool = False,
+) -> None:
     """
-    Full pipeline for:
-    - crop raw images into squares for each channel
-    - for each channel:
-        - calc SNR metrics for each image
-        - run ROF
-        - run NREA for directories / and /ROF
+    full_pipeline without intermediate files: the frames are cropped once and passed between the
+    stages as arrays. Per channel the stages form a graph (crop -> ROF -> NREA of the cropped and
+    the ROF frames -> metrics) whose independent tasks, e.g. different channels or the two NREA
+    branches, run concurrently, see helpers.parallel.run_task_graph. The tasks run on threads,
+    except for the ROF frames: skimage's Chambolle solver holds the GIL for much of its work,
+    so the ROF tasks of all channels submit their frames to one shared process pool of
+    n_workers processes. All frames of a channel and its results are held in memory.
+    - write_intermediate: also save the cropped, ROF and NREA frames as TIFFs in the folders
+      full_pipeline uses
+    Only metrics_overview.csv is always written per channel.
     """
+    is_raw = file_format == "dng"
+    cropped_dir = input_dir + "/cropped" + str(crop_factor)
+    center = (center_x, center_y)
 
-    context = click.get_current_context()
+    # like crop, only RAW images are split into channels
+    n_channels = (4 if bayer else 3) if is_raw else 0
 
-    filenames = crop(
-        input_dir=input_dir, is_raw=(format.lower() == "dng"), crop_factor=crop_factor
+    weight_name = str(weight).replace(".", "_")
+    nrea_dir_name = (
+        "/NREA"
+        + f"_{kernel}_{kernel_size}"
+        + ("_accumulated" if accumulate else "_single")
     )
+    nrea_suffix = "_normalized" if normalize else ""
+
+    def crop_task():
+        filenames, frames = [], []
+        for filename, image in iter_cropped_frames(
+            input_dir, is_raw, crop_factor, n_workers, bayer
+        ):
+            filenames.append(filename)
+            frames.append(image)
+        return filenames, np.stack(frames) if frames else None
+
+    def channel_task(c):
+        def task(cropped):
+            frames = np.ascontiguousarray(cropped[1][..., c])
+            if write_intermediate:
+                save_tiffs(
+                    frames, f"{cropped_dir}/channel_{c}", _tiff_names(len(frames))
+                )
+            return frames
+
+        return task
+
+    def ROF_task(c):
+        def task(frames):
+            denoised = np.stack(
+                list(
+                    ROF_denoising_parallel(
+                        frames, weight=weight, n_workers=n_workers, executor=rof_pool
+                    )
+                )
+            )
+            if write_intermediate:
+                output_dir = (
+                    f"{cropped_dir}/channel_{c}/ROF_denoised_{weight_name}_16bit"
+                )
+                save_tiffs(denoised, output_dir, _tiff_names(len(frames)))
+                save_metrics_csv(
+                    metrics_reliability(denoised, center, radius),
+                    output_dir + "/metrics.csv",
+                )
+            return denoised
+
+        return task
+
+    def NREA_task(input_dir_name):
+        def task(frames):
+            # as saved by run_NREA, so the metrics match those of the written TIFFs
+            nrea = np.stack(
+                [
+                    image.astype(np.uint16)
+                    for image in NREA_frames(
+                        frames,
+                        gaussian_blurring=(kernel == "GB"),
+                        kernel_radius=kernel_size,
+                        accumulate=accumulate,
+                        normalize=normalize,
+                    )
+                ]
+            )
+            if write_intermediate:
+                save_tiffs(
+                    nrea,
+                    input_dir_name + nrea_dir_name,
+                    _tiff_names(len(frames), nrea_suffix),
+                )
+            return nrea
+
+        return task
+
+    def metrics_task(c):
+        def task(cropped, *stages):
+            dfs = [calc_metrics(frames, center, radius, offset) for frames in stages]
+            for df in dfs:
+                df.index = _tiff_names(len(df))
+            channel_dir = f"{cropped_dir}/channel_{c}"
+            os.makedirs(channel_dir, exist_ok=True)
+            metrics_overview(cropped[0], dfs).to_csv(
+                channel_dir + "/metrics_overview.csv"
+            )
+
+        return task
+
+    tasks = {"crop": (crop_task, [])}
+    for c in range(n_channels):
+        channel_dir = f"{cropped_dir}/channel_{c}"
+        rof_dir = channel_dir + f"/ROF_denoised_{weight_name}_16bit"
+        tasks[f"channel_{c}"] = (channel_task(c), ["crop"])
+        tasks[f"ROF_{c}"] = (ROF_task(c), [f"channel_{c}"])
+        tasks[f"NREA_{c}"] = (NREA_task(channel_dir), [f"channel_{c}"])
+        tasks[f"NREA_ROF_{c}"] = (NREA_task(rof_dir), [f"ROF_{c}"])
+        tasks[f"metrics_{c}"] = (
+            metrics_task(c),
+            ["crop", f"channel_{c}", f"ROF_{c}", f"NREA_{c}", f"NREA_ROF_{c}"],
+        )
+
+    tasks = {
+        name: (instrumented(f"stage {name}")(func), dependencies)
+        for name, (func, dependencies) in tasks.items()
+    }
+
+    rof_pool = None
+    if n_workers is None or n_workers > 1:
+        rof_pool = ProcessPoolExecutor(max_workers=n_workers)
+    try:
+        run_task_graph(tasks, n_workers=n_workers)
+    finally:
+        if rof_pool is not None:
+            rof_pool.shutdown(cancel_futures=True)
+
+
+def full_pipeline_on_disk(
+    input_dir: str,
+    crop_factor: int,
+    bayer: bool,
+    file_format: str,
+    center_x: int,
+    center_y: int,
+    radius: int,
+    offset: int,
+    kernel: str,
+    kernel_size: int,
+    accumulate: bool,
+    normalize: bool,
+    weight: float,
+    use_cache: bool = True,
+) -> None:
+    """
+    full_pipeline through TIFF files: every stage reads the frames written by the previous one.
+    Stages whose inputs and parameters did not change since the last run are skipped, see
+    helpers/stage_cache.py.
+    """
+    context = click.get_current_context()
+
+    # every stage is keyed by its parameters and the keys of the stages it reads from, so after
+    # changing e.g. the ROF weight only the ROF, NREA on ROF and metrics stages are rerun
     cropped_dir = input_dir + "/cropped" + str(crop_factor)
+    input_files = fingerprint_files(input_dir, list_image_files(input_dir, file_format))
+    crop_key, filenames = run_stage(
+        "crop",
+        cropped_dir,
+        inputs=input_files,
+        params={"crop_factor": crop_factor, "bayer": bayer, "format": file_format},
+        func=lambda: crop(
+            input_dir=input_dir,
+            is_raw=(file_format == "dng"),
+            crop_factor=crop_factor,
+            bayer=bayer,
+        ),
+        use_cache=use_cache,
+    )
 
     # list of channels
     channels = [
@@ -73,48 +282,68 @@ def full_pipeline(
         if os.path.isdir(os.path.join(cropped_dir, f))
     ]
 
+    roi_params = {"center_x": center_x, "center_y": center_y, "radius": radius}
+    nrea_params = {
+        **roi_params,
+        "kernel": kernel,
+        "kernel_size": kernel_size,
+        "accumulate": accumulate,
+        "normalize": normalize,
+    }
+
     # run pipeline for each channel
     for channel in channels:
         channel_dir = os.path.join(cropped_dir, channel)
-        rof_dir = channel_dir + f"/ROF_denoised_{str(weight).replace(".", "_")}_16bit"
+        channel_key = hash_key(crop_key, channel)
+        weight_name = str(weight).replace(".", "_")
+        rof_dir = channel_dir + f"/ROF_denoised_{weight_name}_16bit"
         nrea_dir_name = (
             "/NREA"
             + f"_{kernel}_{kernel_size}"
             + ("_accumulated" if accumulate else "_single")
         )
-        context.invoke(
-            run_ROF_denoising,
-            input_dir=channel_dir,
-            is_raw=False,
-            center_x=center_x,
-            center_y=center_y,
-            radius=radius,
-            weight=0.9,
-        )
-        context.invoke(
-            run_NREA,
-            input_dir=channel_dir,
-            is_raw=False,
-            center_x=center_x,
-            center_y=center_y,
-            radius=radius,
-            kernel=kernel,
-            kernel_size=kernel_size,
-            accumulate=accumulate,
-            normalize=normalize,
-        )
-        context.invoke(
-            run_NREA,
-            input_dir=rof_dir,
-            is_raw=False,
-            center_x=center_x,
-            center_y=center_y,
-            radius=radius,
-            kernel=kernel,
-            kernel_size=kernel_size,
-            accumulate=accumulate,
-            normalize=normalize,
+
+        rof_key, _ = run_stage(
+            "ROF",
+            rof_dir,
+            inputs=[channel_key],
+            params={**roi_params, "weight": weight},
+            func=lambda: context.invoke(
+                run_ROF_denoising,
+                input_dir=channel_dir,
+                is_raw=False,
+                center_x=center_x,
+                center_y=center_y,
+                radius=radius,
+                weight=weight,
+            ),
+            use_cache=use_cache,
         )
+        nrea_keys = []
+        for nrea_input_dir, input_key in [
+            (channel_dir, channel_key),
+            (rof_dir, rof_key),
+        ]:
+            nrea_key, _ = run_stage(
+                "NREA",
+                nrea_input_dir + nrea_dir_name,
+                inputs=[input_key],
+                params=nrea_params,
+                func=lambda: context.invoke(
+                    run_NREA,
+                    input_dir=nrea_input_dir,
+                    is_raw=False,
+                    center_x=center_x,
+                    center_y=center_y,
+                    radius=radius,
+                    kernel=kernel,
+                    kernel_size=kernel_size,
+                    accumulate=accumulate,
+                    normalize=normalize,
+                ),
+                use_cache=use_cache,
+            )
+            nrea_keys.append(nrea_key)
 
         paths = [
             channel_dir,
@@ -122,21 +351,116 @@ def full_pipeline(
             channel_dir + nrea_dir_name,
             rof_dir + nrea_dir_name,
         ]
-        df_col_prefixes = ["RAW_", "ROF_", "NREA_", "NREA_ROF_"]
-        df_channel = pd.DataFrame()
-        df_channel["image"] = filenames
-        for i, path in enumerate(paths):
-            df = calc_metrics_for_folder(
-                input_dir=path,
-                format="tiff",
-                center_x=center_x,
-                center_y=center_y,
-                radius=radius,
-                offset=offset,
+
+        def calc_metrics_overview():
+            dfs = [
+                calc_metrics_for_folder(
+                    input_dir=path,
+                    format="tiff",
+                    center_x=center_x,
+                    center_y=center_y,
+                    radius=radius,
+                    offset=offset,
+                )
+                for path in paths
+            ]
+            df_channel = metrics_overview(filenames, dfs)
+            df_channel.to_csv(channel_dir + "/metrics_overview.csv")
+
+        run_stage(
+            "metrics",
+            channel_dir,
+            inputs=[channel_key, rof_key, *nrea_keys],
+            params={**roi_params, "offset": offset},
+            func=calc_metrics_overview,
+            use_cache=use_cache,
+        )
+
+
+@click.command()
+@input_dir_option
+@crop_factor_option
+@bayer_option
+@format_option
+@center_x_option
+@center_y_option
+@radius_option
+@offset_option
+@weight_option
+@kernel_option
+@kernel_size_option
+@accumulate_option
+@normalize_option
+@use_cache_option
+@in_memory_option
+@write_intermediate_option
+@n_workers_option
+@profile_option
+def full_pipeline(
+    input_dir: str,
+    crop_factor: int,
+    bayer: bool,
+    format: str,
+    center_x: int,
+    center_y: int,
+    radius: int,
+    offset: int,
+    kernel: str,
+    kernel_size: int,
+    accumulate: bool,
+    normalize: bool,
+    weight: float,
+    use_cache: bool = True,
+    in_memory: bool = False,
+    write_intermediate: bool = False,
+    n_workers: int = None,
+    profile: bool = False,
+):
+    """
+    Full pipeline for:
+    - crop raw images into squares for each channel (R, G, B or Bayer planes R, G1, G2, B)
+    - for each channel:
+        - calc SNR metrics for each image
+        - run ROF
+        - run NREA for directories / and /ROF
+    Stages whose inputs and parameters did not change since the last run are skipped, see
+    full_pipeline_on_disk. With in_memory, the stages pass the frames in memory instead, see
+    full_pipeline_in_memory.
+    With profile, wall time, CPU time, bytes read / written and peak memory of the stages and
+    the main functions are saved per call to input_dir/profile/records.csv and per stage to
+    input_dir/profile/summary.json, see helpers/instrumentation.py.
+    """
+    if profile:
+        profile_path = input_dir + "/profile"
+        enable_profiling(profile_path)
+
+    params = dict(
+        input_dir=input_dir,
+        crop_factor=crop_factor,
+        bayer=bayer,
+        file_format=format.lower(),
+        center_x=center_x,
+        center_y=center_y,
+        radius=radius,
+        offset=offset,
+        kernel=kernel,
+        kernel_size=kernel_size,
+        accumulate=accumulate,
+        normalize=normalize,
+        weight=weight,
+    )
+    try:
+        if in_memory:
+            full_pipeline_in_memory(
+                **params, n_workers=n_workers, write_intermediate=write_intermediate
             )
-            df.columns = [df_col_prefixes[i] + col for col in df.columns]
-            df_channel = pd.concat([df_channel, df], axis=1)
-        df_channel.to_csv(channel_dir + "/metrics_overview.csv")
+        else:
+            full_pipeline_on_disk(**params, use_cache=use_cache)
+    finally:
+        if profile:
+            disable_profiling()
+            summary = write_report(profile_path)
+            print(summary.to_string())
 
 
 if __name__ == "__main__":
@@ -8,14 +8,24 @@ import click
 
 from metrics.SNR_metrics import calc_SNR
 
-from denoising.image_stacking import mean_stacking, median_stacking
-from helpers.helpers import load_images_from_folder
+from denoising.image_stacking import (
+    mean_stacking,
+    median_stacking,
+    sigma_clipped_mean_stacking,
+    trimmed_mean_stacking,
+    winsorized_mean_stacking,
+)
+from helpers.frame_stack import open_frames, stack_base_dir
 from helpers.CLI_options import (
     input_dir_option,
     is_raw_option,
     center_x_option,
     center_y_option,
     radius_option,
+    n_workers_option,
+    clip_sigma_option,
+    trim_proportion_option,
+    align_option,
 )
 
 
@@ -25,63 +35,77 @@ from helpers.CLI_options import (
 @center_x_option
 @center_y_option
 @radius_option
+@clip_sigma_option
+@trim_proportion_option
+@align_option
+@n_workers_option
 def run_image_stacking(
-    input_dir: str, is_raw: bool, center_x: int, center_y: int, radius: int
+    input_dir: str,
+    is_raw: bool,
+    center_x: int,
+    center_y: int,
+    radius: int,
+    clip_sigma: float,
+    trim_proportion: float,
+    align: bool = False,
+    n_workers: int = None,
 ):
-    # LOAD IMAGES
-    file_format = "dng" if is_raw else "tiff"
-    images, _ = load_images_from_folder(
-        input_dir, file_format=file_format, bit_depth=16
-    )
-
-    output_dir = input_dir + "/image_stacking"
+    output_dir = stack_base_dir(input_dir) + "/image_stacking"
+    if align:
+        output_dir += "_aligned"
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    # STACKING
-    arithmetic_mean = mean_stacking(images)
-    median = median_stacking(images)
+    # LOAD IMAGES (memory-mapped)
+    file_format = "dng" if is_raw else "tiff"
+    with open_frames(
+        input_dir,
+        file_format=file_format,
+        bit_depth=16,
+        n_workers=n_workers,
+        align=align,
+    ) as (images, _):
+        # STACKING
+        stacked_images = {
+            "Arithmetic Mean": mean_stacking(images),
+            "Median": median_stacking(images),
+            "Sigma-Clipped Mean": sigma_clipped_mean_stacking(images, sigma=clip_sigma),
+            "Trimmed Mean": trimmed_mean_stacking(images, proportion=trim_proportion),
+            "Winsorized Mean": winsorized_mean_stacking(
+                images, proportion=trim_proportion
+            ),
+        }
 
     # SNR
     center = (center_x, center_y)
 
-    snr_arithmetic, signal_arithmetic, noise_arithmetic, _, _ = calc_SNR(
-        arithmetic_mean, center, radius
-    )
-    snr_median, signal_median, noise_median, _, _ = calc_SNR(median, center, radius)
+    metrics = {"SNR": [], "Signal": [], "Noise": []}
+    for stacked_image in stacked_images.values():
+        snr, signal, noise, _, _ = calc_SNR(stacked_image, center, radius)
+        metrics["SNR"].append(snr)
+        metrics["Signal"].append(signal)
+        metrics["Noise"].append(noise)
 
     # SAVE METRICS TO CSV
     output_path = os.path.join(output_dir, "SNR_metrics.csv")
-    df = pd.DataFrame(
-        {
-            "SNR": [snr_arithmetic, snr_median],
-            "Signal": [signal_arithmetic, signal_median],
-            "Noise": [noise_arithmetic, noise_median],
-        },
-        index=["Arithmetic Mean", "Median"],
-    )
+    df = pd.DataFrame(metrics, index=list(stacked_images.keys()))
     df.to_csv(output_path)
 
-    # SAVE IMAGE AS TIFF
-    output_path_arithmetic = os.path.join(output_dir, "arithmetic_mean.tiff")
-    arithmetic_mean_uint8 = arithmetic_mean.astype(np.uint8)
-    im = Image.fromarray(arithmetic_mean_uint8)
-    im.save(output_path_arithmetic)
-
-    output_path_median = os.path.join(output_dir, "median.tiff")
-    median_uint8 = median.astype(np.uint8)
-    im = Image.fromarray(median_uint8)
-    im.save(output_path_median)
+    # SAVE IMAGES AS TIFF
+    stacked_images_uint8 = {}
+    for mode, stacked_image in stacked_images.items():
+        stacked_images_uint8[mode] = stacked_image.astype(np.uint8)
+        filename = mode.lower().replace("-", "_").replace(" ", "_") + ".tiff"
+        im = Image.fromarray(stacked_images_uint8[mode])
+        im.save(os.path.join(output_dir, filename))
 
     # DISPLAY IMAGES
     plt.figure()
     plt.suptitle("Image Stacking")
-    plt.subplot(121)
-    plt.imshow(arithmetic_mean_uint8)
-    plt.title("Arithmetic Mean")
-    plt.subplot(122)
-    plt.imshow(median_uint8)
-    plt.title("Median")
+    for i, (mode, stacked_image_uint8) in enumerate(stacked_images_uint8.items()):
+        plt.subplot(1, len(stacked_images_uint8), i + 1)
+        plt.imshow(stacked_image_uint8)
+        plt.title(mode)
 
     plt.show()
 
@@ -0,0 +1,63 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from metrics.SNR_metrics import SNRMeasurement, calc_SNR
+
+
+def baseline_calc_SNR(img, center, radius, offset_background=None):
+    # calc_SNR before SNRMeasurement: full-frame masks and numpy statistics
+    img = img.astype(np.float64)
+    half_s = np.sqrt(2) * radius / 2
+    y, x = np.ogrid[: img.shape[0], : img.shape[1]]
+    square_mask = (
+        (x >= center[0] - half_s)
+        & (x <= center[0] + half_s)
+        & (y >= center[1] - half_s)
+        & (y <= center[1] + half_s)
+    )
+    square = img[square_mask]
+
+    offset_background = radius if offset_background is None else offset_background
+    bg_mask = ~(
+        (x - center[0]) ** 2 + (y - center[1]) ** 2 <= (radius + offset_background) ** 2
+    )
+    bg = img[bg_mask]
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean_roi, mean_bg = np.mean(square), np.mean(bg)
+        signal = mean_roi - mean_bg
+        noise = np.sqrt((np.std(square) ** 2 + np.std(bg) ** 2) / 2)
+        return signal / noise, signal, noise, mean_roi, mean_bg
+
+
+@pytest.mark.parametrize(
+    "center",
+    [
+        (30, 20),  # inside
+        (0, 20),  # ROI half outside the left edge
+        (59, 39),  # ROI in the bottom right corner
+        (-4, 20),  # ROI partly outside
+        (100, 100),  # ROI fully outside
+        (30, 20, "disk covers the frame"),
+    ],
+)
+@pytest.mark.parametrize("channels", [0, 3])
+def test_matches_baseline_at_frame_edges(center, channels):
+    radius = 100 if len(center) == 3 else 6
+    center = center[:2]
+    shape = (40, 60, channels) if channels else (40, 60)
+    img = np.random.default_rng(0).integers(0, 4000, shape, dtype=np.uint16)
+
+    expected = baseline_calc_SNR(img, center, radius)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        results = [
+            calc_SNR(img, center, radius),
+            SNRMeasurement(img.shape, center, radius).evaluate(img),
+        ]
+
+    for result in results:
+        np.testing.assert_allclose(result, expected, rtol=1e-9, equal_nan=True)
@@ -0,0 +1,39 @@
+import pytest
+
+pytest.importorskip("seaborn")
+
+import compare_native_to_custom
+from metrics.results_sink import ResultsSink
+
+
+def test_resume_completes_channels_missing_a_row(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        compare_native_to_custom,
+        "_job_metrics",
+        lambda job, channel_wise, offset: [(1.0, 2.0, 3.0)] * 3,
+    )
+    jobs = [
+        (str(tmp_path / f"img_{i}.dng"), "phone", "custom", 100, 10, (5, 5), 2)
+        for i in range(2)
+    ]
+    paths = [str(tmp_path / f"channel{c}.csv") for c in range(3)]
+    columns = compare_native_to_custom.COLUMNS
+
+    # interrupted run: the row of img_0 only reached channel 0
+    with ResultsSink(paths[0], columns, key="file") as sink:
+        sink.append(
+            smartphone="phone",
+            app="custom",
+            iso=100,
+            expot=10,
+            SNR=1.0,
+            Signal=2.0,
+            Noise=3.0,
+            file="img_0.dng",
+        )
+
+    sinks = [ResultsSink(path, columns, key="file", resume=True) for path in paths]
+    compare_native_to_custom.scan_dataset(str(tmp_path), jobs, sinks, True, 5, 1)
+
+    for sink in sinks:
+        assert sorted(sink.to_dataframe()["file"]) == ["img_0.dng", "img_1.dng"]
@@ -0,0 +1,59 @@
+import os
+import multiprocessing
+
+import numpy as np
+
+from helpers.frame_cache import FrameCache
+
+FRAME_BYTES = 2**20
+MAX_BYTES = 10 * FRAME_BYTES
+
+
+def _fill_cache(task: tuple[str, int]) -> None:
+    cache_dir, worker = task
+    cache = FrameCache(cache_dir, max_bytes=MAX_BYTES)
+    for i in range(10):
+        cache.put(f"{worker}_{i}", np.zeros(FRAME_BYTES // 8))
+
+
+def _entry_bytes(cache_dir: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(cache_dir, filename))
+        for filename in os.listdir(cache_dir)
+        if filename.endswith(".npy")
+    )
+
+
+def test_limit_holds_for_concurrent_processes(tmp_path):
+    with multiprocessing.Pool(8) as pool:
+        pool.map(_fill_cache, [(str(tmp_path), worker) for worker in range(8)])
+
+    assert _entry_bytes(tmp_path) <= MAX_BYTES
+    assert not [f for f in os.listdir(tmp_path) if f.endswith(".tmp")]
+
+
+def test_limit_holds_for_instances_sharing_a_directory(tmp_path):
+    caches = [FrameCache(str(tmp_path), max_bytes=MAX_BYTES) for _ in range(8)]
+    for i in range(10):
+        for worker, cache in enumerate(caches):
+            cache.put(f"{worker}_{i}", np.zeros(FRAME_BYTES // 8))
+            assert _entry_bytes(tmp_path) <= MAX_BYTES
+
+    # the most recently written entries are kept
+    assert caches[0].get("7_9") is not None
+    assert caches[0].get("0_0") is None
+
+
+def test_failed_put_removes_temporary_file(tmp_path, monkeypatch):
+    cache = FrameCache(str(tmp_path))
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(np, "save", fail)
+    try:
+        cache.put("key", np.zeros(3))
+    except OSError:
+        pass
+
+    assert not [f for f in os.listdir(tmp_path) if f.endswith((".tmp", ".npy"))]
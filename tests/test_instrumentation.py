@@ -0,0 +1,35 @@
+import time
+
+import numpy as np
+
+from helpers import instrumentation
+
+
+def test_peak_rss_of_a_block(tmp_path):
+    instrumentation.enable_profiling(str(tmp_path))
+    try:
+        with instrumentation.measure("allocate"):
+            data = np.ones(100 * 2**20 // 8)
+            time.sleep(0.05)
+            del data
+        with instrumentation.measure("nothing"):
+            time.sleep(0.05)
+    finally:
+        instrumentation.disable_profiling()
+
+    records = instrumentation.load_records(str(tmp_path)).set_index("stage")
+    if records["peak_rss_mb"].isna().all():
+        return  # RSS cannot be read on this system
+    assert records.loc["allocate", "rss_growth_mb"] > 50
+    assert records.loc["nothing", "rss_growth_mb"] < 50
+
+
+def test_sampler_stops_when_idle():
+    sampler = instrumentation._rss_sampler
+    token = object()
+    sampler.start(token, 0)
+    assert sampler._thread is not None
+    sampler.stop(token, 0)
+
+    time.sleep(10 * instrumentation.RSS_SAMPLE_INTERVAL_S)
+    assert sampler._thread is None
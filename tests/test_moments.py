@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from metrics.moments import Moments
+from metrics.SNR_metrics import SNRMeasurement
+
+
+@pytest.mark.parametrize("dtype", [np.uint16, np.float32])
+def test_matches_numpy(dtype):
+    data = np.random.default_rng(0).integers(0, 4000, (3, 1000)).astype(dtype)
+    moments = Moments.from_array(data)
+
+    np.testing.assert_allclose(moments.mean, data.mean(axis=-1, dtype=np.float64))
+    np.testing.assert_allclose(moments.std, data.astype(np.float64).std(axis=-1))
+
+
+@pytest.mark.parametrize("dtype", [np.uint16, np.float32])
+def test_empty_sample_is_nan(dtype):
+    moments = Moments.from_array(np.zeros((2, 0), dtype=dtype))
+
+    np.testing.assert_array_equal(moments.count, [0, 0])
+    assert np.isnan(moments.mean).all()
+    assert np.isnan(moments.m2).all()
+    assert np.isnan(moments.std).all()
+
+
+def test_merge_and_subtract_with_empty_samples():
+    data = np.arange(10, dtype=np.uint16)[np.newaxis]
+    moments = Moments.from_array(data)
+    empty = Moments.from_array(data[:, :0])
+
+    for merged in (moments.merge(empty), empty.merge(moments)):
+        np.testing.assert_allclose(merged.mean, moments.mean)
+        np.testing.assert_allclose(merged.m2, moments.m2)
+
+    unchanged = moments.subtract(empty)
+    np.testing.assert_allclose(unchanged.mean, moments.mean)
+    np.testing.assert_allclose(unchanged.m2, moments.m2)
+
+    nothing_left = moments.subtract(moments)
+    assert nothing_left.count[0] == 0
+    assert np.isnan(nothing_left.mean[0]) and np.isnan(nothing_left.m2[0])
+    assert np.isnan(empty.merge(empty).mean[0])
+
+
+def test_subtract_is_inverse_of_merge():
+    rng = np.random.default_rng(1)
+    a = Moments.from_array(rng.normal(5, 2, (4, 300)))
+    b = Moments.from_array(rng.normal(-1, 3, (4, 200)))
+    restored = a.merge(b).subtract(b)
+
+    np.testing.assert_allclose(restored.mean, a.mean)
+    np.testing.assert_allclose(restored.m2, a.m2)
+
+
+def test_roi_outside_frame_is_nan():
+    frames = np.random.default_rng(2).integers(0, 4000, (3, 40, 40), dtype=np.uint16)
+    measurement = SNRMeasurement(frames.shape[1:], center=(200, 200), radius=5)
+    snr, signal, noise, mean_roi, mean_bg = measurement.evaluate_stack(frames)
+
+    assert np.isnan(mean_roi).all()
+    assert np.isnan(signal).all() and np.isnan(snr).all()
+    # the background is the whole frame
+    np.testing.assert_allclose(mean_bg, frames.reshape(3, -1).mean(axis=-1))
@@ -0,0 +1,33 @@
+import os
+
+import click
+
+import run_batch
+
+
+@click.command()
+@click.option("--input_dir", type=str)
+def write_table(input_dir: str):
+    with open(os.path.join(input_dir, "metrics.csv"), "w") as f:
+        f.write(",SNR,Signal,Noise\nmean,2.0,10.0,5.0\n")
+
+
+def test_job_metrics_from_written_csv(tmp_path, monkeypatch):
+    monkeypatch.setattr(run_batch, "_load_command", lambda name: write_table)
+    row = run_batch.run_job((1, {"command": "run_NREA", "input_dir": str(tmp_path)}))
+
+    assert row["status"] == "ok"
+    assert row["outputs"] == "metrics.csv"
+    assert '"SNR": 2.0' in row["metrics"]
+
+
+def test_unreadable_output_fails_only_the_job(tmp_path, monkeypatch):
+    def unreadable(output_dir, before):
+        raise ValueError("half-written CSV")
+
+    monkeypatch.setattr(run_batch, "_load_command", lambda name: write_table)
+    monkeypatch.setattr(run_batch, "_output_metrics", unreadable)
+    row = run_batch.run_job((1, {"command": "run_NREA", "input_dir": str(tmp_path)}))
+
+    assert row["status"] == "failed"
+    assert "half-written CSV" in row["error"]